@@ -1,4 +1,5 @@
 import numpy as np
+import time
 
 np.random.seed(0)
 
@@ -12,58 +13,74 @@ plts = []
 def sigmoid(x):
     return 1. / (1 + np.exp(-x))
 
-for _i in range(len(lrs)):
-    lr = lrs[_i]
-    
-    # perceptron
-    np.random.seed(0)
-    w = np.random.normal(0., 1, (3))
-    print("weight >>", w)
+# train K perceptrons at once, one per (lr, seed) : w [K, 3]
+# returns the final weights and their trajectories [K, iteration + 1, 3]
+def train_sweep(lrs, seeds, iteration=1000):
+    lrs = np.asarray(lrs, dtype=np.float64)[:, None]
+
+    # perceptron, each one initialized as np.random.seed(seed); np.random.normal(0., 1, (3))
+    w = np.array([np.random.RandomState(seed).normal(0., 1, (3)) for seed in seeds])
 
     # add bias
     z1 = np.hstack([xs, [[1] for _ in range(4)]])
 
-    # train
-    ite = 1
-    w1 = [w[0]]
-    w2 = [w[1]]
-    w3 = [w[2]]
+    history = np.empty((len(w), iteration + 1, 3))
+    history[:, 0] = w
+    ys = np.empty((len(w), len(z1)))
+    En = np.empty_like(ys)
+    grad_w = np.empty_like(w)
+
+    for ite in range(iteration):
+        # feed forward of every perceptron : [K, 4]
+        np.einsum('nd,kd->kn', z1, w, out=ys)
+        np.negative(ys, out=ys)
+        np.exp(ys, out=ys)
+        ys += 1
+        np.reciprocal(ys, out=ys)
 
-    for _ in range(1000):
-        # feed forward
-        ys = sigmoid(np.dot(z1, w))
-        #ys = sigmoid(np.array(list(map(lambda x: np.dot(w, x), z1))))
+        # En = -2 * (ys - ts) * ys * (1 - ys), reusing ys as it is consumed
+        np.subtract(ts, ys, out=En)
+        En *= 2
+        En *= ys
+        np.subtract(1, ys, out=ys)
+        En *= ys
 
-        print("iteration:", ite, "y >>", ys)
+        np.einsum('nd,kn->kd', z1, En, out=grad_w)
+        grad_w *= lrs
+        w += grad_w
 
-        En = -2 * (ys - ts) * ys * (1 - ys)
-        grad_w = np.dot(z1.T, En)
-        w += lr * grad_w
+        history[:, ite + 1] = w
 
-        w1.append(w[0])
-        w2.append(w[1])
-        w3.append(w[2])
+    return w, history
 
-        ite += 1
 
-    print("training finished!")
-    print("weight >>", w)
+# the two learning rates of the figure, both from seed 0
+ws, history = train_sweep(lrs, [0] * len(lrs))
 
-    inds = list(range(ite))
+for _i in range(len(lrs)):
+    print("lr >>", lrs[_i], "weight >>", ws[_i])
+
+    inds = list(range(history.shape[1]))
     import matplotlib.pyplot as plt
     linestyle = linestyles[_i]
-    plts.append(plt.plot(inds, w1, markeredgewidth=0, linestyle=linestyle)[0])
-    plts.append(plt.plot(inds, w2, markeredgewidth=0, linestyle=linestyle)[0])
-    plts.append(plt.plot(inds, w3, markeredgewidth=0, linestyle=linestyle)[0])
+    plts.append(plt.plot(inds, history[_i, :, 0], markeredgewidth=0, linestyle=linestyle)[0])
+    plts.append(plt.plot(inds, history[_i, :, 1], markeredgewidth=0, linestyle=linestyle)[0])
+    plts.append(plt.plot(inds, history[_i, :, 2], markeredgewidth=0, linestyle=linestyle)[0])
 
 plt.legend(plts, ["w1:lr=0.1","w2:lr=0.1","w3:lr=0.1","w1:lr=0.01","w2:lr=0.01","w3:lr=0.01"], loc=1)
 plt.savefig("answer_perceptron3.png")
 plt.show()
 
+# sweep : 1000 configurations (lr x seed) in one batched run
+sweep_lrs, sweep_seeds = np.meshgrid(np.logspace(-3, 0, 100), np.arange(10))
+t = time.perf_counter()
+sweep_ws, sweep_history = train_sweep(sweep_lrs.ravel(), sweep_seeds.ravel())
+print("sweep of", len(sweep_ws), "configurations >> {:.2f} s".format(time.perf_counter() - t))
+
 # test
 #ys = np.array(list(map(lambda x: np.dot(w, x), _xs)))
 
+w = ws[-1]
 for i in range(4):
     ys = sigmoid(np.dot(w, np.hstack([xs[i], [1]])))
-    print("in >>", xs[i], ", out >>", ys) 
-    
+    print("in >>", xs[i], ", out >>", ys)
@@ -1,4 +1,5 @@
 import numpy as np
+import time
 
 np.random.seed(0)
 
@@ -76,6 +77,74 @@ class Model():
             
 
 
+# N replicas of a Model of FullyConnectedLayers trained together. every w is stacked to [N, in, out]
+# and every b to [N, 1, out], so a layer is one batched matmul for all the replicas instead of N small GEMMs.
+# the replicas see the same minibatch and are updated exactly as N separate Models would be
+class Ensemble():
+    def __init__(self, *models, lr=0.1):
+        for l in models[0].layers:
+            if not isinstance(l, FullyConnectedLayer):
+                raise Exception('invalid layer >> ', type(l).__name__, 'should be FullyConnectedLayer')
+
+        self.replica_num = len(models)
+        self.ws = [np.stack([m.layers[i].w for m in models]) for i in range(len(models[0].layers))]
+        self.bs = [None if l.b is None else np.stack([m.layers[i].b for m in models])[:, None]
+                   for i, l in enumerate(models[0].layers)]
+        self.activations = [l.activation for l in models[0].layers]
+        self.lr = lr
+
+    # x : [mb, in] shared by every replica -> [N, mb, out]
+    def forward(self, x):
+        x = x.reshape(len(x), -1)
+        self.x_ins = []
+        self.x_outs = []
+
+        for w, b, activation in zip(self.ws, self.bs, self.activations):
+            self.x_ins.append(x)
+            x = np.matmul(x, w)
+
+            if b is not None:
+                x += b
+
+            if activation is not None:
+                x = activation(x)
+            self.x_outs.append(x)
+
+        self.output = x
+
+        return x
+
+    def backward(self, t):
+        En = (self.output - t) * self.output * (1 - self.output)
+        grad_pro = En
+        w_pro = np.eye(En.shape[-1])
+
+        for i in range(len(self.ws))[::-1]:
+            w, b, x_in, x_out = self.ws[i], self.bs[i], self.x_ins[i], self.x_outs[i]
+
+            grad = np.matmul(grad_pro, np.swapaxes(w_pro, -1, -2))
+            if self.activations[i] is sigmoid:
+                grad *= (x_out * (1 - x_out))
+
+            # the first layer input is shared, [mb, in].T @ [N, mb, out] broadcasts over the replicas
+            grad_w = np.matmul(np.swapaxes(x_in, -1, -2), grad)
+            grad_w *= self.lr
+            w -= grad_w
+
+            if b is not None:
+                grad_b = grad.sum(axis=1, keepdims=True)
+                grad_b *= self.lr
+                b -= grad_b
+
+            grad_pro = grad
+            w_pro = w
+
+    # [N]
+    def loss(self, t):
+        Loss = np.sum((self.output - t) ** 2, axis=(1, 2)) / 2 / t.shape[0]
+        return Loss
+
+
 model = Model(FullyConnectedLayer(in_n=2, out_n=64, activation=sigmoid),
               FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
               FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1)
@@ -93,3 +162,24 @@ for i in range(4):
     out = model.forward(xs[i])
     print("in >>", xs[i], ", out >>", out)
     
+
+
+# ensemble : the same network from 100 seeds, trained in one batched run
+def make_model(seed):
+    np.random.seed(seed)
+    return Model(FullyConnectedLayer(in_n=2, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1)
+
+ensemble = Ensemble(*[make_model(seed) for seed in range(100)], lr=0.1)
+
+t = time.perf_counter()
+for ite in range(10000):
+    ensemble.forward(xs)
+    ensemble.backward(ts)
+t = time.perf_counter() - t
+
+outs = ensemble.forward(xs)
+solved = np.all((outs > 0.5) == ts, axis=(1, 2))
+print("ensemble of", ensemble.replica_num, ">> {:.1f} s, solved {} / {}, loss min {:.4f} max {:.4f}".format(
+    t, solved.sum(), ensemble.replica_num, ensemble.loss(ts).min(), ensemble.loss(ts).max()))
@@ -0,0 +1,71 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def get_out_size(height, width, k_size, stride=1, pad=0):
+    out_height = (height + pad * 2 - k_size) // stride + 1
+    out_width = (width + pad * 2 - k_size) // stride + 1
+    return out_height, out_width
+
+
+# [mb, c, h, w] -> [c * k * k, mb * out_h * out_w]
+def im2col(x, k_size, stride=1, pad=0):
+    if pad > 0:
+        x = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)))
+
+    # zero-copy view of every k x k window : [mb, c, h', w', k, k]
+    windows = sliding_window_view(x, (k_size, k_size), axis=(2, 3))
+    windows = windows[:, :, ::stride, ::stride]
+    mb, c, out_height, out_width = windows.shape[:4]
+
+    # the only copy : lay the windows out as columns for the GEMM,
+    # keeping out_w innermost so the gather reads along image rows
+    col = windows.transpose(1, 4, 5, 0, 2, 3).reshape(c * k_size * k_size, mb * out_height * out_width)
+
+    return col, out_height, out_width
+
+
+# [c * k * k, mb * out_h * out_w] -> [mb, c, h, w]  (overlapping windows are summed)
+def col2im(col, x_shape, k_size, stride=1, pad=0):
+    mb, c, height, width = x_shape
+    out_height, out_width = get_out_size(height, width, k_size, stride=stride, pad=pad)
+
+    col = col.reshape(c, k_size, k_size, mb, out_height, out_width).transpose(3, 0, 1, 2, 4, 5)
+    x = np.zeros((mb, c, height + pad * 2, width + pad * 2), dtype=col.dtype)
+
+    # loop only over the kernel positions, each one is a strided add over the whole batch
+    for ky in range(k_size):
+        y_max = ky + stride * out_height
+        for kx in range(k_size):
+            x_max = kx + stride * out_width
+            x[..., ky: y_max: stride, kx: x_max: stride] += col[:, :, ky, kx]
+
+    return x[..., pad: pad + height, pad: pad + width]
+
+
+# kernels : [k_channel, k, k] (shared over input channels, as in conv_kernel.py)
+#        or [k_channel, in_c, k, k]
+def _kernel_matrix(kernels, in_c):
+    if kernels.ndim == 3:
+        kernels = np.broadcast_to(kernels[:, None], (kernels.shape[0], in_c) + kernels.shape[1:])
+    return kernels.reshape(kernels.shape[0], -1)
+
+
+# x : [mb, c, h, w] or [c, h, w]
+def conv2d(x, kernels, stride=1, pad=0):
+    single = x.ndim == 3
+    if single:
+        x = x[None]
+
+    k_size = kernels.shape[-1]
+    col, out_height, out_width = im2col(x, k_size, stride=stride, pad=pad)
+
+    # one GEMM for the whole batch and every kernel
+    w = _kernel_matrix(kernels, x.shape[1])
+    out = np.dot(w, col)
+    out = out.reshape(-1, x.shape[0], out_height, out_width).transpose(1, 0, 2, 3)
+
+    if single:
+        out = out[0]
+
+    return out
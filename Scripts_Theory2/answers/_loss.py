@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# logits -> (mean loss, En = dLoss/dlogits * mb) in one pass, with buffers kept per logits shape and dtype.
+# En is not divided by mb, like the En of the Model classes, so the learning rates stay as they are.
+# the returned En is overwritten by the next call with the same shape and dtype
+class CrossEntropy():
+    def __init__(self):
+        self.workspaces = {}
+
+    def get_workspace(self, shape, dtype):
+        ws = self.workspaces.get((shape, dtype))
+        if ws is None:
+            ws = (np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype))
+            self.workspaces[(shape, dtype)] = ws
+        return ws
+
+
+# binary cross-entropy on sigmoid(logits), t in {0, 1} : [mb, n]
+# loss = max(z, 0) - z * t + log(1 + exp(-|z|)) never takes the log of a saturated sigmoid
+class SigmoidCrossEntropy(CrossEntropy):
+    def __call__(self, logits, t):
+        En, e = self.get_workspace(logits.shape, logits.dtype)
+
+        # e = exp(-|z|) <= 1, so nothing overflows
+        np.abs(logits, out=e)
+        np.negative(e, out=e)
+        np.exp(e, out=e)
+
+        # sigmoid(z) = 1 / (1 + e) for z >= 0, e / (1 + e) = 1 - 1 / (1 + e) for z < 0
+        e += 1
+        np.reciprocal(e, out=En)
+        np.subtract(1, En, out=En, where=logits < 0)
+
+        np.log(e, out=e)
+        loss = e.sum() + np.maximum(logits, 0, out=e).sum() - np.vdot(logits, t)
+
+        En -= t
+
+        return loss / len(logits), En
+
+
+def softmax(x):
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+
+# softmax cross-entropy, t : class indices [mb] / [mb, 1] or one-hot [mb, class_num]
+# loss = logsumexp(z) - z[t], taken after subtracting the row max so exp never overflows
+class SoftmaxCrossEntropy(CrossEntropy):
+    def __call__(self, logits, t):
+        En, e = self.get_workspace(logits.shape, logits.dtype)
+        mb = len(logits)
+
+        z_max = logits.max(axis=1, keepdims=True)
+        np.subtract(logits, z_max, out=e)
+        np.exp(e, out=En)
+        z_sum = En.sum(axis=1, keepdims=True)
+
+        # dLoss/dz = softmax(z) - onehot(t)
+        En /= z_sum
+        if t.shape == logits.shape:
+            z_t = np.einsum('ij,ij->i', logits, t)
+            En -= t
+        else:
+            t = t.reshape(mb)
+            z_t = logits[np.arange(mb), t]
+            En[np.arange(mb), t] -= 1
+
+        loss = np.sum(np.log(z_sum)) + np.sum(z_max) - np.sum(z_t)
+
+        return loss / mb, En
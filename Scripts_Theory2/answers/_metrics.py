@@ -0,0 +1,142 @@
+import numpy as np
+import threading
+
+
+# per-step metrics in a preallocated [capacity, 1 + len(names)] ring buffer (iteration, then the metrics).
+# record() keeps one row every `every` steps : the values of that step (reduce='last') or the mean of the
+# window (reduce='mean'), and a background thread appends the rows to path every flush_interval seconds,
+# or once capacity // 2 rows are waiting. path ending in .npy writes a [rows, 1 + len(names)] float64 array,
+# anything else a csv with the header iteration,name,..., so pd.read_csv readers keep working even mid-run.
+# memory stays at capacity rows however long the run, recent() returns the rows still in the ring.
+# lazy=True keeps the values as given (e.g. tf / torch scalar tensors) and converts them with float() only when
+# the rows are flushed or read, so record() does not wait for the device every step.
+# Scripts_Theory2/answers/_metrics.py and tf/_main_base.py hold the same class : change them together
+class MetricsRecorder():
+    def __init__(self, names, path=None, every=1, reduce='last', capacity=4096, flush_interval=1., lazy=False):
+        if reduce not in ['last', 'mean']:
+            raise Exception('invalid reduce >> ', reduce, 'should be last or mean')
+        self.names = list(names)
+        self.path = path
+        self.every = every
+        self.reduce = reduce
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self.buf = np.zeros((capacity, 1 + len(self.names)), dtype=np.float64)
+        self.acc = np.zeros(len(self.names), dtype=np.float64)
+        self.acc_num = 0
+        # lazy : the unconverted values of every row (a list of per-step values), and of the running window
+        self.lazy = lazy
+        self.pending = [None] * capacity if lazy else None
+        self.window = []
+        # rows recorded / rows written to path / rows converted into buf
+        self.n = 0
+        self.flushed = 0
+        self.converted = 0
+        self.lock = threading.Lock()
+
+        self.f = None
+        self.thread = None
+        if path is not None:
+            self.npy = path.endswith('.npy')
+            self.f = open(path, 'wb')
+            if self.npy:
+                self.write_npy_header()
+            else:
+                self.f.write((','.join(['iteration'] + self.names) + '\n').encode())
+            self.wake = threading.Event()
+            self.stop = threading.Event()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    # the header is padded to a fixed 128 bytes, so it can be rewritten with the final row count in place
+    def write_npy_header(self):
+        header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(
+            self.flushed, 1 + len(self.names))
+        header = header.ljust(128 - 10 - 1) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode())
+        self.f.seek(0, 2)
+
+    def record(self, iteration, *values, **named):
+        if len(named) > 0:
+            values = [named[name] for name in self.names]
+
+        if self.reduce == 'mean':
+            if self.lazy:
+                self.window.append(values)
+            else:
+                self.acc += values
+                self.acc_num += 1
+        if iteration % self.every != 0:
+            return
+
+        if self.n - self.flushed >= self.capacity:
+            # the writer fell a whole ring behind, write out here rather than drop rows
+            self.flush()
+
+        row = self.buf[self.n % self.capacity]
+        row[0] = iteration
+        if self.lazy:
+            self.pending[self.n % self.capacity] = self.window if self.reduce == 'mean' else [values]
+            self.window = []
+        elif self.reduce == 'mean':
+            np.divide(self.acc, self.acc_num, out=row[1:])
+            self.acc[:] = 0
+            self.acc_num = 0
+        else:
+            row[1:] = values
+        self.n += 1
+
+        if self.thread is not None and self.n - self.flushed >= self.capacity // 2:
+            self.wake.set()
+
+    # lazy : the values of the rows up to end into buf, the rows the ring already overwrote are skipped
+    def materialize(self, end):
+        if not self.lazy:
+            return
+        for i in range(max(self.converted, end - self.capacity), end):
+            window = self.pending[i % self.capacity]
+            self.buf[i % self.capacity, 1:] = np.mean([[float(v) for v in values] for values in window], axis=0)
+            self.pending[i % self.capacity] = None
+        self.converted = max(self.converted, end)
+
+    def recent(self):
+        with self.lock:
+            n = self.n
+            self.materialize(n)
+            return self.buf[np.arange(max(n - self.capacity, 0), n) % self.capacity]
+
+    def flush(self):
+        with self.lock:
+            if self.f is None:
+                return
+            start, end = self.flushed, self.n
+            self.materialize(end)
+            for i in range(start, end, self.capacity):
+                rows = self.buf[np.arange(i, min(end, i + self.capacity)) % self.capacity]
+                if self.npy:
+                    self.f.write(rows.tobytes())
+                else:
+                    np.savetxt(self.f, rows, delimiter=',', fmt=['%d'] + ['%.8g'] * len(self.names))
+            self.flushed = end
+            self.f.flush()
+
+    def worker(self):
+        while not self.stop.is_set():
+            self.wake.wait(timeout=self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        if self.f is not None:
+            if self.npy:
+                self.write_npy_header()
+            self.f.close()
+            self.f = None
@@ -0,0 +1,928 @@
+import numpy as np
+import copy
+from glob import glob
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import time
+import cv2
+from _conv import im2col, col2im
+from _pool import max_pool2d, ave_pool2d, max_pool2d_backward, ave_pool2d_backward
+from _optimizer import Adam
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+# activations Model.save can write by name
+activations = {'sigmoid': sigmoid}
+
+
+def activation_name(activation):
+    if activation is None:
+        return None
+    for name, func in activations.items():
+        if func is activation:
+            return name
+    raise Exception('invalid activation >> ', activation, 'should be None or one of', list(activations))
+
+
+# float32 GEMMs slow down by orders of magnitude on subnormal numbers (the far tails of
+# sigmoid and the gradients through them), so flush those to zero.
+# tmp (x.shape, x.dtype) / mask (x.shape, bool) : preallocated buffers, so the workspace mode allocates nothing
+def flush_subnormal(x, tmp=None, mask=None):
+    tmp = np.abs(x, out=tmp)
+    mask = np.less(tmp, np.finfo(x.dtype).tiny, out=mask)
+    np.copyto(x, 0, where=mask)
+    return x
+
+
+# param -= step, taken on the float64 master copy (then cast back) when the layer keeps one
+def apply_step(param, step, master=None):
+    if master is None:
+        param -= step
+    else:
+        master -= step
+        np.copyto(param, master, casting='same_kind')
+
+
+class FullyConnectedLayer():
+    # w / b : initial values (e.g. the arrays Model.load maps) instead of random ones
+    def __init__(self, in_n, out_n, use_bias=True, activation=None, w=None, b=None):
+        self.w = np.random.normal(0, 1, [in_n, out_n]) if w is None else w
+        if use_bias:
+            self.b = np.random.normal(0, 1, [out_n]) if b is None else b
+        else:
+            self.b = None
+        if activation is not None:
+            self.activation = activation
+        else:
+            self.activation = None
+        self.workspace = False
+        self.w_master = None
+        self.b_master = None
+        self.flush = False
+        self.optimizer = None
+        # _profile.Profiler timing the sub-phases (gemm, activation, update) of forward / backward
+        self.profiler = None
+
+    def set_lr(self, lr=0.1):
+        self.lr = lr
+
+    # None : plain SGD with self.lr
+    def set_optimizer(self, optimizer=None):
+        self.optimizer = optimizer
+
+    # grad is scratch, it may be overwritten
+    def update(self, param, grad, master=None):
+        if self.optimizer is not None:
+            self.optimizer.update(param, grad, master)
+        else:
+            grad *= self.lr
+            apply_step(param, grad, master)
+
+    # keep w / b (and so activations and gradients) in one precision,
+    # optionally with a float64 master copy that accumulates the updates
+    def set_dtype(self, dtype=np.float32, master=False):
+        self.w_master = self.w.astype(np.float64) if master else None
+        self.w = self.w.astype(dtype)
+        self.flush = np.dtype(dtype) == np.float32
+        if self.b is not None:
+            self.b_master = self.b.astype(np.float64) if master else None
+            self.b = self.b.astype(dtype)
+
+    # constructor arguments, for Model.save
+    def get_config(self):
+        return {'in_n': self.w.shape[0], 'out_n': self.w.shape[1], 'use_bias': self.b is not None,
+                'activation': activation_name(self.activation)}
+
+    # reuse preallocated buffers (one set per batch size) instead of allocating every iteration.
+    # the array returned by forward is overwritten by the next forward with the same batch size
+    def set_workspace(self, workspace=True):
+        self.workspace = workspace
+        self.workspaces = {}
+        self.grad_w = np.empty_like(self.w)
+        self.grad_b = np.empty_like(self.b) if self.b is not None else None
+
+    def get_workspace(self, mb, dtype):
+        ws = self.workspaces.get(mb)
+        if ws is None:
+            out_n = self.w.shape[1]
+            ws = {'x': np.empty((mb, out_n), dtype=dtype),
+                  'grad': np.empty((mb, out_n), dtype=dtype),
+                  'tmp': np.empty((mb, out_n), dtype=dtype),
+                  'mask': np.empty((mb, out_n), dtype=bool)}
+            self.workspaces[mb] = ws
+        return ws
+
+    def forward(self, feature_in):
+        # flatten [mb, c, h, w] coming from ConvLayer / PoolLayer
+        if feature_in.ndim > 2:
+            feature_in = feature_in.reshape(len(feature_in), -1)
+
+        if self.workspace:
+            return self.forward_workspace(feature_in)
+
+        self.x_in = feature_in
+        x = self.predict(feature_in)
+        self.x_out = x
+
+        return x
+
+    # forward without keeping anything for backward
+    def predict(self, feature_in):
+        if feature_in.ndim > 2:
+            feature_in = feature_in.reshape(len(feature_in), -1)
+
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
+
+        x = np.dot(feature_in, self.w)
+        if prof is not None:
+            t = prof.lap('gemm', t, gemm=2 * x.size * self.w.shape[0])
+
+        if self.b is not None:
+            x += self.b
+            if prof is not None:
+                t = prof.lap('bias', t)
+
+        if self.activation is not None:
+            x = self.activation(x)
+        if self.flush:
+            flush_subnormal(x)
+        if prof is not None:
+            prof.lap('activation', t)
+
+        return x
+
+    def forward_workspace(self, feature_in):
+        dtype = np.result_type(feature_in, self.w)
+        ws = self.get_workspace(len(feature_in), dtype)
+
+        # cast once into the workspace, otherwise both GEMMs make their own upcast copy
+        if feature_in.dtype != dtype:
+            if 'x_in' not in ws:
+                ws['x_in'] = np.empty(feature_in.shape, dtype=dtype)
+            np.copyto(ws['x_in'], feature_in)
+            feature_in = ws['x_in']
+        self.x_in = feature_in
+
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
+
+        x = np.dot(feature_in, self.w, out=ws['x'])
+        if prof is not None:
+            t = prof.lap('gemm', t, gemm=2 * x.size * self.w.shape[0])
+
+        if self.b is not None:
+            # a same-shape add : broadcasting b makes numpy allocate an iterator buffer on every call
+            np.copyto(ws['tmp'], self.b)
+            x += ws['tmp']
+            if prof is not None:
+                t = prof.lap('bias', t)
+
+        if self.activation is sigmoid:
+            # 1 / (1 + exp(-x)) in place
+            np.negative(x, out=x)
+            np.exp(x, out=x)
+            x += 1
+            np.reciprocal(x, out=x)
+        elif self.activation is not None:
+            x = self.activation(x)
+        if self.flush:
+            flush_subnormal(x, tmp=ws['tmp'], mask=ws['mask'])
+        if prof is not None:
+            prof.lap('activation', t)
+        self.x_out = x
+
+        return x
+
+
+    def backward(self, w_pro, grad_pro):
+        if self.workspace:
+            return self.backward_workspace(w_pro, grad_pro)
+
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
+
+        if w_pro is None:
+            # a copy, grad is scaled in place below and grad_pro belongs to the caller
+            grad = grad_pro.reshape(self.x_out.shape).copy()
+        else:
+            grad = np.dot(grad_pro, w_pro.T)
+            if prof is not None:
+                t = prof.lap('gemm grad', t, gemm=2 * grad.size * w_pro.shape[1])
+        if self.activation is sigmoid:
+            grad *= (self.x_out * (1 - self.x_out))
+        if self.flush:
+            flush_subnormal(grad)
+        if prof is not None:
+            t = prof.lap('activation', t)
+
+        grad_w = np.dot(self.x_in.T, grad)
+        if prof is not None:
+            t = prof.lap('gemm grad_w', t, gemm=2 * grad_w.size * len(grad))
+        self.update(self.w, grad_w, self.w_master)
+
+        if self.b is not None:
+            grad_b = np.dot(np.ones([grad.shape[0]], dtype=grad.dtype), grad)
+            self.update(self.b, grad_b, self.b_master)
+        if prof is not None:
+            prof.lap('update', t)
+
+        return grad
+
+    def backward_workspace(self, w_pro, grad_pro):
+        ws = self.get_workspace(len(self.x_out), self.x_out.dtype)
+        grad = ws['grad']
+
+        prof = self.profiler
+        if prof is not None:
+            t = time.perf_counter()
+
+        if w_pro is None:
+            grad[...] = grad_pro.reshape(self.x_out.shape)
+        else:
+            np.dot(grad_pro, w_pro.T, out=grad)
+            if prof is not None:
+                t = prof.lap('gemm grad', t, gemm=2 * grad.size * w_pro.shape[1])
+        if self.activation is sigmoid:
+            tmp = ws['tmp']
+            np.subtract(1, self.x_out, out=tmp)
+            tmp *= self.x_out
+            grad *= tmp
+        if self.flush:
+            flush_subnormal(grad, tmp=ws['tmp'], mask=ws['mask'])
+        if prof is not None:
+            t = prof.lap('activation', t)
+
+        grad_w = np.dot(self.x_in.T, grad, out=self.grad_w)
+        if prof is not None:
+            t = prof.lap('gemm grad_w', t, gemm=2 * grad_w.size * len(grad))
+        self.update(self.w, grad_w, self.w_master)
+
+        if self.b is not None:
+            grad_b = np.sum(grad, axis=0, out=self.grad_b)
+            self.update(self.b, grad_b, self.b_master)
+        if prof is not None:
+            prof.lap('update', t)
+
+        return grad
+
+
+# unlike FullyConnectedLayer, ConvLayer and PoolLayer return the gradient w.r.t. their input,
+# so the layer before them gets w_pro=None
+class ConvLayer():
+    # w / b : initial values (e.g. the arrays Model.load maps) instead of random ones
+    def __init__(self, in_c, out_c, k_size=3, stride=1, pad=0, use_bias=True, activation=None, w=None, b=None):
+        self.k_size = k_size
+        self.stride = stride
+        self.pad = pad
+        # scaled by the fan-in so that sigmoid does not saturate from the first iteration
+        if w is None:
+            w = np.random.normal(0, 1, [out_c, in_c, k_size, k_size]) / np.sqrt(in_c * k_size * k_size)
+        self.w = w
+        if use_bias:
+            self.b = np.random.normal(0, 1, [out_c]) if b is None else b
+        else:
+            self.b = None
+        self.activation = activation
+        # the first layer of a Model has no use for the gradient w.r.t. the input image
+        self.need_grad_in = True
+        self.w_master = None
+        self.b_master = None
+        self.flush = False
+        self.optimizer = None
+
+    def set_lr(self, lr=0.1):
+        self.lr = lr
+
+    # None : plain SGD with self.lr
+    def set_optimizer(self, optimizer=None):
+        self.optimizer = optimizer
+
+    # grad is scratch, it may be overwritten
+    def update(self, param, grad, master=None):
+        if self.optimizer is not None:
+            self.optimizer.update(param, grad, master)
+        else:
+            grad *= self.lr
+            apply_step(param, grad, master)
+
+    # keep w / b (and so activations and gradients) in one precision,
+    # optionally with a float64 master copy that accumulates the updates
+    def set_dtype(self, dtype=np.float32, master=False):
+        self.w_master = self.w.astype(np.float64) if master else None
+        self.w = self.w.astype(dtype)
+        self.flush = np.dtype(dtype) == np.float32
+        if self.b is not None:
+            self.b_master = self.b.astype(np.float64) if master else None
+            self.b = self.b.astype(dtype)
+
+    # constructor arguments, for Model.save
+    def get_config(self):
+        out_c, in_c, k_size, _ = self.w.shape
+        return {'in_c': in_c, 'out_c': out_c, 'k_size': k_size, 'stride': self.stride, 'pad': self.pad,
+                'use_bias': self.b is not None, 'activation': activation_name(self.activation)}
+
+    def forward(self, feature_in):
+        self.x_shape = feature_in.shape
+        x, self.col = self.conv(feature_in)
+        self.x_out = x
+
+        return x
+
+    # forward without keeping anything for backward
+    def predict(self, feature_in):
+        return self.conv(feature_in)[0]
+
+    def conv(self, feature_in):
+        mb = len(feature_in)
+        col, out_height, out_width = im2col(feature_in, self.k_size, stride=self.stride, pad=self.pad)
+
+        # [out_c, mb * out_h * out_w]
+        x = np.dot(self.w.reshape(len(self.w), -1), col)
+
+        if self.b is not None:
+            x += self.b[:, None]
+
+        if self.activation is not None:
+            x = self.activation(x)
+        if self.flush:
+            flush_subnormal(x)
+        x = x.reshape(-1, mb, out_height, out_width).transpose(1, 0, 2, 3)
+
+        return x, col
+
+    def backward(self, w_pro, grad_pro):
+        if w_pro is None:
+            grad = grad_pro.reshape(self.x_out.shape)
+        else:
+            grad = np.dot(grad_pro, w_pro.T).reshape(self.x_out.shape)
+        if self.activation is sigmoid:
+            grad = grad * (self.x_out * (1 - self.x_out))
+        if self.flush:
+            flush_subnormal(grad)
+
+        # [mb, out_c, out_h, out_w] -> [out_c, mb * out_h * out_w]
+        grad = grad.transpose(1, 0, 2, 3).reshape(len(self.w), -1)
+        w = self.w.reshape(len(self.w), -1)
+
+        grad_in = None
+        if self.need_grad_in:
+            grad_in = col2im(np.dot(w.T, grad), self.x_shape, self.k_size, stride=self.stride, pad=self.pad)
+
+        grad_w = np.dot(grad, self.col.T)
+        self.update(self.w, grad_w.reshape(self.w.shape), self.w_master)
+
+        if self.b is not None:
+            grad_b = grad.sum(axis=1)
+            self.update(self.b, grad_b, self.b_master)
+
+        return grad_in
+
+
+class PoolLayer():
+    def __init__(self, k_size=2, stride=2, mode='max'):
+        self.k_size = k_size
+        self.stride = stride
+        self.mode = mode
+
+    def set_lr(self, lr=0.1):
+        pass
+
+    def set_optimizer(self, optimizer=None):
+        pass
+
+    def set_dtype(self, dtype=np.float32, master=False):
+        pass
+
+    def get_config(self):
+        return {'k_size': self.k_size, 'stride': self.stride, 'mode': self.mode}
+
+    def forward(self, feature_in):
+        self.x_shape = feature_in.shape
+
+        if self.mode == 'max':
+            x, self.ind = max_pool2d(feature_in, k_size=self.k_size, stride=self.stride)
+        elif self.mode == 'ave':
+            x = ave_pool2d(feature_in, k_size=self.k_size, stride=self.stride)
+        else:
+            raise Exception('invalid mode >> ', self.mode, 'should be max or ave')
+        self.x_out = x
+
+        return x
+
+    # forward without keeping anything for backward
+    def predict(self, feature_in):
+        if self.mode == 'max':
+            return max_pool2d(feature_in, k_size=self.k_size, stride=self.stride)[0]
+        elif self.mode == 'ave':
+            return ave_pool2d(feature_in, k_size=self.k_size, stride=self.stride)
+        raise Exception('invalid mode >> ', self.mode, 'should be max or ave')
+
+    def backward(self, w_pro, grad_pro):
+        if w_pro is None:
+            grad = grad_pro.reshape(self.x_out.shape)
+        else:
+            grad = np.dot(grad_pro, w_pro.T).reshape(self.x_out.shape)
+
+        if self.mode == 'max':
+            return max_pool2d_backward(grad, self.ind, self.x_shape, k_size=self.k_size, stride=self.stride)
+        return ave_pool2d_backward(grad, self.x_shape, k_size=self.k_size, stride=self.stride)
+
+
+model_magic = b'NNWEIGHT'
+model_align = 64
+
+
+# criterion : a _loss criterion (e.g. SigmoidCrossEntropy()) taking the logits the last layer outputs,
+# None keeps the squared error on the sigmoid output
+class Model():
+    def __init__(self, *args, lr=0.1, optimizer=None, workspace=False, dtype=None, master=False, criterion=None):
+        self.layers = args
+        for l in self.layers:
+            l.set_lr(lr=lr)
+            l.set_optimizer(optimizer)
+            if dtype is not None:
+                l.set_dtype(dtype, master=master)
+            if workspace and isinstance(l, FullyConnectedLayer):
+                l.set_workspace()
+        self.layers[0].need_grad_in = False
+        self.lr = lr
+        self.workspace = workspace
+        self.workspaces = {}
+        self.dtype = dtype
+        self.criterion = criterion
+        self.profiler = None
+
+    # e.g. _profile.Profiler(), None switches it off. FullyConnectedLayers also time their sub-phases
+    def set_profiler(self, profiler=None):
+        self.profiler = profiler
+        for layer in self.layers:
+            if isinstance(layer, FullyConnectedLayer):
+                layer.profiler = profiler
+
+    def forward(self, x):
+        # without this a float32 image batch meets float64 weights and every GEMM upcasts
+        if self.dtype is not None:
+            x = x.astype(self.dtype, copy=False)
+
+        for i, layer in enumerate(self.layers):
+            if self.profiler is None:
+                x = layer.forward(x)
+            else:
+                x = self.profiler.call(i, layer, 'forward', layer.forward, x)
+        self.output = x
+
+        return x
+
+    # outputs for a whole set, batch_size samples per GEMM. the layers keep nothing for backward,
+    # so this can run between training iterations without disturbing them
+    def inference(self, xs, batch_size=256):
+        out = None
+
+        for i in range(0, len(xs), batch_size):
+            x = xs[i: i + batch_size]
+            if self.dtype is not None:
+                x = x.astype(self.dtype, copy=False)
+
+            for layer in self.layers:
+                x = layer.predict(x)
+
+            if out is None:
+                out = np.empty((len(xs),) + x.shape[1:], dtype=x.dtype)
+            out[i: i + len(x)] = x
+
+        return out
+
+    def backward(self, t):
+        if self.dtype is not None:
+            t = np.asarray(t, dtype=self.dtype)
+
+        if self.criterion is not None:
+            # the loss comes with En, loss() returns it
+            self.Loss, En = self.criterion(self.output, t)
+            w_pro = self.get_workspace(self.output.shape, self.output.dtype)[2]
+        elif self.workspace:
+            En, tmp, w_pro = self.get_workspace(self.output.shape, self.output.dtype)
+            np.subtract(self.output, t, out=En)
+            En *= self.output
+            np.subtract(1, self.output, out=tmp)
+            En *= tmp
+        else:
+            En = (self.output - t) * self.output * (1 - self.output)
+            w_pro = np.eye(En.shape[-1], dtype=En.dtype)
+        grad_pro = En
+
+        for i, layer in enumerate(self.layers[::-1]):
+            if self.profiler is None:
+                grad_pro = layer.backward(w_pro=w_pro, grad_pro=grad_pro)
+            else:
+                grad_pro = self.profiler.call(len(self.layers) - 1 - i, layer, 'backward', layer.backward,
+                                              w_pro=w_pro, grad_pro=grad_pro)
+            w_pro = layer.w if isinstance(layer, FullyConnectedLayer) else None
+
+    def get_workspace(self, shape, dtype):
+        ws = self.workspaces.get(shape)
+        if ws is None:
+            ws = (np.empty(shape, dtype=dtype), np.empty(shape, dtype=dtype), np.eye(shape[-1], dtype=dtype))
+            self.workspaces[shape] = ws
+        return ws
+
+
+    def loss(self, t):
+        if self.criterion is not None:
+            return self.Loss
+        Loss = np.sum((self.output - t) ** 2) / 2 / t.shape[0]
+        return Loss
+
+    # one file : 'NNWEIGHT', the header length (uint64) and a json header with the layer configs,
+    # lr, workspace and dtype, then every w / b raw at a 64 byte aligned offset.
+    # only the working precision is stored (not the float64 masters nor the optimizer state)
+    def save(self, path):
+        header = {'lr': self.lr, 'workspace': self.workspace,
+                  'dtype': None if self.dtype is None else np.dtype(self.dtype).str, 'layers': []}
+        params = []
+        offset = 0
+        for layer in self.layers:
+            spec = {'type': type(layer).__name__, 'config': layer.get_config(), 'params': {}}
+            for name in ['w', 'b']:
+                param = getattr(layer, name, None)
+                if param is None:
+                    continue
+                param = np.ascontiguousarray(param)
+                spec['params'][name] = {'dtype': param.dtype.str, 'shape': list(param.shape), 'offset': offset}
+                params.append((offset, param))
+                offset += -(-param.nbytes // model_align) * model_align
+            header['layers'].append(spec)
+
+        header = json.dumps(header).encode()
+        header += b' ' * (-(len(model_magic) + 8 + len(header)) % model_align)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(model_magic)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            start = f.tell()
+            for offset, param in params:
+                f.seek(start + offset)
+                f.write(param.data)
+        os.replace(tmp_path, path)
+
+    # mmap=True maps the file copy-on-write : loading reads only the header, the weights are paged in
+    # on first use and shared by every process that maps the same file. training such a model still works,
+    # the pages it writes become private to the process
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path, 'rb') as f:
+            if f.read(len(model_magic)) != model_magic:
+                raise Exception('invalid file >> ', path, 'should be written by Model.save')
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_len).decode())
+        start = len(model_magic) + 8 + header_len
+
+        if mmap:
+            # a plain ndarray view, so that arrays made like the weights (np.empty_like ...) are not memmaps
+            buf = np.asarray(np.memmap(path, dtype=np.uint8, mode='c'))
+        else:
+            buf = np.fromfile(path, dtype=np.uint8)
+
+        layer_classes = {c.__name__: c for c in [FullyConnectedLayer, ConvLayer, PoolLayer]}
+        dtype = None if header['dtype'] is None else np.dtype(header['dtype'])
+        layers = []
+        for spec in header['layers']:
+            config = dict(spec['config'])
+            if 'activation' in config:
+                config['activation'] = None if config['activation'] is None else activations[config['activation']]
+            for name, p in spec['params'].items():
+                p_dtype = np.dtype(p['dtype'])
+                offset = start + p['offset']
+                nbytes = int(np.prod(p['shape'])) * p_dtype.itemsize
+                config[name] = buf[offset: offset + nbytes].view(p_dtype).reshape(p['shape'])
+            layer = layer_classes[spec['type']](**config)
+            if dtype is not None and 'w' in spec['params']:
+                layer.flush = dtype == np.float32
+            layers.append(layer)
+
+        model = cls(*layers, lr=header['lr'], workspace=header['workspace'])
+        model.dtype = dtype
+        return model
+
+
+# times forward / backward of a copy of model (the model itself is not trained) for every batch size
+# of mbs on random rows of xs / ts, and returns {'mb', 'lr', 'samples_per_sec' : {mb : samples/sec}}.
+# mb is the knee : the smallest batch size reaching tolerance of the best throughput, larger ones only
+# cost memory and updates per epoch. lr is the learning rate to train with it, scaled from the one tuned
+# for base_mb : En is summed over the minibatch, so SGD / Momentum steps already grow linearly with mb
+# and keep their lr, while Adam normalizes the gradient scale away and takes the square-root rule
+def autotune_minibatch(model, xs, ts, mbs=(8, 16, 32, 64, 128, 256, 512, 1024), base_mb=64, tolerance=0.9,
+                       min_time=0.2, verbose=True):
+    model = copy.deepcopy(model)
+    rng = np.random.RandomState(0)
+
+    samples_per_sec = {}
+    for mb in mbs:
+        # drawn with replacement, so mb may exceed the data
+        ind = rng.randint(0, len(xs), mb)
+        x, t = xs[ind], ts[ind]
+
+        # the first step allocates the workspaces
+        model.forward(x)
+        model.backward(t)
+
+        n = 0
+        start = time.perf_counter()
+        while n == 0 or time.perf_counter() - start < min_time:
+            model.forward(x)
+            model.backward(t)
+            n += 1
+        samples_per_sec[mb] = n * mb / (time.perf_counter() - start)
+
+    best = max(samples_per_sec.values())
+    knee = min(mb for mb, sps in samples_per_sec.items() if sps >= tolerance * best)
+
+    optimizer = next((l.optimizer for l in model.layers if getattr(l, 'optimizer', None) is not None), None)
+    if optimizer is None:
+        lr = model.lr
+    elif isinstance(optimizer, Adam):
+        lr = optimizer.lr * np.sqrt(knee / base_mb)
+    else:
+        lr = optimizer.lr
+
+    if verbose:
+        for mb, sps in samples_per_sec.items():
+            print('mb {:5d} >> {:9.0f} samples/sec{}'.format(mb, sps, ' <- knee' if mb == knee else ''))
+        print('autotune >> mb:', knee, 'lr:', lr)
+
+    return {'mb': knee, 'lr': lr, 'samples_per_sec': samples_per_sec}
+
+
+CLS = ['akahara', 'madara']
+
+# func over items in order, on a thread pool when num_workers > 1 (-1 : one per core).
+# cv2 decode / resize / warp release the GIL, so threads scale without pickling the images.
+# no more threads than items, so a single item starts no pool
+def map_ordered(func, items, num_workers=0):
+    if num_workers < 0:
+        num_workers = os.cpu_count()
+    num_workers = min(num_workers, len(items))
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            return list(pool.map(func, items))
+
+    return [func(item) for item in items]
+
+
+# decode, resize and normalize one image : [h, w, c] RGB in [0, 1]
+def load_image(path, img_height=64, img_width=64):
+    x = cv2.imread(path)
+    x = cv2.resize(x, (img_width, img_height)).astype(np.float32)
+    x /= 255.
+    x = x[..., ::-1]
+    return x
+
+
+# get train data
+def data_load(path, hf=False, vf=False, rot=None, img_height=64, img_width=64, cache_dir=None, num_workers=0):
+    if cache_dir is not None:
+        return data_load_cache(path, hf=hf, vf=vf, rot=rot, img_height=img_height, img_width=img_width,
+                               cache_dir=cache_dir, num_workers=num_workers)
+
+    xs = []
+    ts = []
+    paths = []
+
+    file_paths = [file_path for dir_path in glob(path + '/*') for file_path in glob(dir_path + '/*')]
+    images = map_ordered(lambda file_path: load_image(file_path, img_height, img_width), file_paths,
+                         num_workers=num_workers)
+
+    for path, x in zip(file_paths, images):
+        xs.append(x)
+
+        for i, cls in enumerate(CLS):
+            if cls in path:
+                t = i
+
+        ts.append(t)
+
+        paths.append(path)
+
+        if hf:
+            xs.append(x[:, ::-1])
+            ts.append(t)
+            paths.append(path)
+
+        if vf:
+            xs.append(x[::-1])
+            ts.append(t)
+            paths.append(path)
+
+        if hf and vf:
+            xs.append(x[::-1, ::-1])
+            ts.append(t)
+            paths.append(path)
+
+        if rot is not None:
+            angle = rot
+            _x = np.ascontiguousarray(x)
+
+            while angle < 360:
+                xs.append(rotate(_x, angle))
+                ts.append(t)
+                paths.append(path)
+                angle += rot
+
+    ts = [[t] for t in ts]
+
+    xs = np.array(xs, dtype=np.float32)
+    ts = np.array(ts, dtype=np.int64)
+
+    xs = xs.transpose(0,3,1,2)
+
+    return xs, ts, paths
+
+
+# bumped whenever data_load changes the samples it returns, so older caches are not reused
+data_cache_version = 2
+
+# data_load through an .npy cache of the decoded, resized and normalized tensor.
+# the key covers every image path with its mtime and the load options, and later runs
+# memory-map the cache instead of decoding, so startup time and RSS stay flat
+def data_load_cache(path, hf=False, vf=False, rot=None, img_height=64, img_width=64, cache_dir='.cache',
+                    num_workers=0):
+    key = hashlib.sha1(repr((data_cache_version, img_height, img_width, hf, vf, rot)).encode())
+    for dir_path in glob(path + '/*'):
+        for file_path in glob(dir_path + '/*'):
+            key.update('{}:{}\n'.format(os.path.abspath(file_path), os.stat(file_path).st_mtime_ns).encode())
+
+    cache_path = os.path.join(cache_dir, key.hexdigest()[:16] + '_{}.npy')
+
+    if not os.path.exists(cache_path.format('paths')):
+        xs, ts, paths = data_load(path, hf=hf, vf=vf, rot=rot, img_height=img_height, img_width=img_width,
+                                  num_workers=num_workers)
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # paths is written last and renamed into place, so it marks a complete cache
+        for name, x in [('xs', np.ascontiguousarray(xs)), ('ts', ts), ('paths', np.array(paths))]:
+            tmp_path = cache_path.format(name) + '.tmp.npy'
+            np.save(tmp_path, x)
+            os.replace(tmp_path, cache_path.format(name))
+
+    xs = np.load(cache_path.format('xs'), mmap_mode='r')
+    ts = np.load(cache_path.format('ts'))
+    paths = np.load(cache_path.format('paths')).tolist()
+
+    return xs, ts, paths
+
+
+def rotate(x, angle, scale=1):
+    _h, _w, _c = x.shape
+    max_side = max(_h, _w)
+    tx = int((max_side - _w) / 2)
+    ty = int((max_side - _h) / 2)
+    if _h != _w:
+        tmp = np.zeros((max_side, max_side, _c), dtype=x.dtype)
+        tmp[ty: ty+_h, tx: tx+_w] = x
+        x = tmp
+    M = cv2.getRotationMatrix2D((max_side/2, max_side/2), angle, scale)
+    _x = cv2.warpAffine(x, M, (max_side, max_side))
+    return _x[ty:ty+_h, tx:tx+_w].reshape(_h, _w, _c)
+
+
+# same samples as data_load(path, hf, vf, rot), but only the base images are kept in memory
+# and the flip / rotation of a sample is applied when it is drawn into a minibatch
+class AugmentDataset():
+    def __init__(self, path, hf=False, vf=False, rot=None, img_height=64, img_width=64, cache_dir=None,
+                 num_workers=0):
+        self.xs, self.ts, self.paths = data_load(path, img_height=img_height, img_width=img_width, cache_dir=cache_dir,
+                                                 num_workers=num_workers)
+
+        # variant table, in the order data_load appends them
+        variants = [(False, False, 0)]
+        if hf:
+            variants.append((True, False, 0))
+        if vf:
+            variants.append((False, True, 0))
+        if hf and vf:
+            variants.append((True, True, 0))
+        if rot is not None:
+            variants += [(False, False, angle) for angle in range(rot, 360, rot)]
+
+        self.hf = np.array([v[0] for v in variants])
+        self.vf = np.array([v[1] for v in variants])
+        self.rot = np.array([v[2] for v in variants])
+        self.variant_num = len(variants)
+
+    def __len__(self):
+        return len(self.xs) * self.variant_num
+
+    def get_path(self, i):
+        return self.paths[i // self.variant_num]
+
+    def __getitem__(self, ind):
+        img_ind, var_ind = np.divmod(np.asarray(ind), self.variant_num)
+        xs = self.xs[img_ind]
+        ts = self.ts[img_ind]
+
+        hf = self.hf[var_ind]
+        if hf.any():
+            xs[hf] = xs[hf][..., ::-1]
+
+        vf = self.vf[var_ind]
+        if vf.any():
+            xs[vf] = xs[vf][..., ::-1, :]
+
+        for i in np.nonzero(self.rot[var_ind])[0]:
+            x = np.ascontiguousarray(xs[i].transpose(1, 2, 0))
+            xs[i] = rotate(x, self.rot[var_ind[i]]).transpose(2, 0, 1)
+
+        return xs, ts
+
+
+# minibatch indices with epoch-exact shuffling : every sample is drawn once per epoch,
+# and a batch crossing the epoch end takes the rest of the old order then the head of a new one.
+# sampler() returns the indices, or fetch(indices) (e.g. a dataset gather + augmentation) when fetch is given.
+# prefetch=K assembles the next K batches on a background thread while the model computes.
+# every tree runs from its own directory, so pytorch/_main_base_generative.py and tf/_main_base.py hold the same class : change them together
+class MinibatchSampler():
+    def __init__(self, data_num, mb, shuffle=True, fetch=None, prefetch=0, seed=None):
+        self.data_num = data_num
+        self.mb = mb
+        self.shuffle = shuffle
+        self.fetch = fetch
+        self.prefetch = prefetch
+        self.epoch = 0
+        self.mbi = 0
+
+        # own random state, so the batches do not depend on the thread drawing them
+        self.rng = np.random.RandomState(np.random.randint(2 ** 31 - 1) if seed is None else seed)
+        self.inds = self.new_order()
+
+        self.queue = None
+        if prefetch > 0:
+            if fetch is None:
+                raise Exception('prefetch needs fetch')
+            self.queue = queue.Queue(maxsize=prefetch)
+            self.stop = threading.Event()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def new_order(self):
+        if self.shuffle:
+            return self.rng.permutation(self.data_num)
+        return np.arange(self.data_num)
+
+    def next_ind(self):
+        mb_ind = self.inds[self.mbi: self.mbi + self.mb]
+        self.mbi += self.mb
+
+        while len(mb_ind) < self.mb:
+            self.inds = self.new_order()
+            self.epoch += 1
+            self.mbi = self.mb - len(mb_ind)
+            mb_ind = np.hstack((mb_ind, self.inds[:self.mbi]))
+
+        return mb_ind
+
+    def worker(self):
+        while not self.stop.is_set():
+            try:
+                batch = (True, self.fetch(self.next_ind()))
+            except Exception as e:
+                batch = (False, e)
+
+            # wake up now and then to see if the sampler was closed
+            while not self.stop.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if not batch[0]:
+                return
+
+    def __call__(self):
+        if self.queue is None:
+            mb_ind = self.next_ind()
+            return mb_ind if self.fetch is None else self.fetch(mb_ind)
+
+        ok, batch = self.queue.get()
+        if not ok:
+            raise batch
+        return batch
+
+    def close(self):
+        if self.queue is not None:
+            self.stop.set()
+            self.thread.join()
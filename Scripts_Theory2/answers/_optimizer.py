@@ -0,0 +1,96 @@
+import numpy as np
+
+
+# update(param, grad, master) : one step on param (or on its float64 master copy, which is then cast back).
+# the state of every parameter is allocated on its first step and then updated in place by chains of
+# ufuncs with out=, so a step makes no temporaries. one optimizer can be shared by all the layers of a Model
+class Optimizer():
+    state_names = []
+
+    def __init__(self, lr):
+        self.lr = lr
+        self.states = {}
+
+    def get_state(self, param):
+        state = self.states.get(id(param))
+        if state is None:
+            state = {'t': 0, 'arrays': [np.zeros_like(param) for _ in self.state_names]}
+            self.states[id(param)] = state
+        state['t'] += 1
+        return state
+
+    def update(self, param, grad, master=None):
+        target = param if master is None else master
+        state = self.get_state(target)
+        self.step(target, grad, state['arrays'], state['t'])
+
+        if master is not None:
+            np.copyto(param, master, casting='same_kind')
+
+
+class SGD(Optimizer):
+    state_names = ['tmp']
+
+    def __init__(self, lr=0.1):
+        super().__init__(lr)
+
+    def step(self, param, grad, state, t):
+        tmp, = state
+        np.multiply(grad, self.lr, out=tmp)
+        param -= tmp
+
+
+# v = momentum * v - lr * grad , param += v
+class Momentum(Optimizer):
+    state_names = ['v', 'tmp']
+
+    def __init__(self, lr=0.01, momentum=0.9):
+        super().__init__(lr)
+        self.momentum = momentum
+
+    def step(self, param, grad, state, t):
+        v, tmp = state
+        np.multiply(grad, self.lr, out=tmp)
+        v *= self.momentum
+        v -= tmp
+        param += v
+
+
+class Adam(Optimizer):
+    state_names = ['m', 'v', 'tmp']
+
+    def __init__(self, lr=0.001, beta1=0.9, beta2=0.999, eps=1e-8):
+        super().__init__(lr)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+
+    def step(self, param, grad, state, t):
+        m, v, tmp = state
+
+        # m = beta1 * m + (1 - beta1) * grad, written as m = beta1 * (m - grad) + grad
+        m -= grad
+        m *= self.beta1
+        m += grad
+
+        # v = beta2 * v + (1 - beta2) * grad ** 2
+        if tmp.dtype == np.float32:
+            # float32 squares of tiny gradients are denormals, which are ~30x slower to compute.
+            # flooring |grad| at 1e-18 keeps v normal, and sqrt(v) that small is far below eps anyway
+            np.abs(grad, out=tmp)
+            np.maximum(tmp, 1e-18, out=tmp)
+            np.square(tmp, out=tmp)
+        else:
+            np.square(grad, out=tmp)
+        v -= tmp
+        v *= self.beta2
+        v += tmp
+
+        # bias correction folded into the step size and eps
+        correction = np.sqrt(1 - self.beta2 ** t)
+        lr_t = self.lr * correction / (1 - self.beta1 ** t)
+        np.sqrt(v, out=tmp)
+        tmp += self.eps * correction
+        np.divide(m, tmp, out=tmp)
+        tmp *= lr_t
+        param -= tmp
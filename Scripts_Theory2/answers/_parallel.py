@@ -0,0 +1,175 @@
+import numpy as np
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from _optimizer import SGD
+
+
+# stands in for the optimizer of a worker's layers : backward hands it every gradient,
+# which is copied to the worker's row of the shared gradients instead of being applied
+class GradientCollector():
+    def __init__(self, grads):
+        # id(param) -> view of the shared gradient buffer
+        self.grads = grads
+
+    def update(self, param, grad, master=None):
+        np.copyto(self.grads[id(param)], grad)
+
+
+# data-parallel training of a Model over num_workers forked processes (-1 : one per cpu).
+# every w / b is moved into one flat shared memory buffer, so the workers and the calling process
+# all see the same parameters. step(x, t) splits the minibatch into num_workers slices; each worker
+# runs forward / backward on its slice and writes its gradients to its own row of a shared
+# [num_workers, param_num] buffer. the rows are then all-reduced as a reduce-scatter : worker k sums
+# the k-th segment over all rows and applies the optimizer to that segment of the parameters.
+#
+# the gradients of a step are all taken at the weights of the start of the step
+# (Model updates a layer before it back-propagates through the layer below, so a serial Model
+# differs slightly). the summed gradient is the one of the whole minibatch, as En is not divided by mb.
+# give each worker one BLAS thread (OMP_NUM_THREADS=1 / OPENBLAS_NUM_THREADS=1 before numpy is imported),
+# otherwise the workers and BLAS fight over the same cores
+class DataParallel():
+    def __init__(self, model, num_workers=-1):
+        if num_workers == -1:
+            num_workers = os.cpu_count()
+        self.model = model
+        self.num_workers = num_workers
+        self.procs = []
+        self.shm = []
+
+        # the update the layers would have done themselves : their optimizer, or plain SGD with lr
+        self.optimizer = next((l.optimizer for l in model.layers if getattr(l, 'optimizer', None) is not None), None)
+        if self.optimizer is None:
+            self.optimizer = SGD(lr=model.lr)
+
+        self.params = []
+        for layer in model.layers:
+            for name in ['w', 'b']:
+                param = getattr(layer, name, None)
+                if param is None:
+                    continue
+                if getattr(layer, name + '_master', None) is not None:
+                    raise Exception('invalid layer >> ', type(layer).__name__, 'should have master=False')
+                self.params.append((layer, name, param))
+        self.dtype = np.result_type(*[p for _, _, p in self.params])
+        self.param_num = sum(p.size for _, _, p in self.params)
+
+        # parameters, then one row of gradients per worker
+        self.flat = self.shared((self.param_num,), self.dtype)
+        self.grads = self.shared((num_workers, self.param_num), self.dtype)
+        offset = 0
+        for layer, name, param in self.params:
+            view = self.flat[offset: offset + param.size].reshape(param.shape)
+            view[...] = param
+            setattr(layer, name, view)
+            offset += param.size
+
+        # worker k updates [bounds[k], bounds[k + 1])
+        self.bounds = np.linspace(0, self.param_num, num_workers + 1).astype(np.int64)
+
+        self.ctl = mp.RawArray('q', 2)
+        self.start = mp.Barrier(num_workers + 1)
+        self.done = mp.Barrier(num_workers + 1)
+        self.reduce = mp.Barrier(num_workers)
+        self.mb_max = 0
+
+    def shared(self, shape, dtype):
+        shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+        self.shm.append(shm)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    # the input / target / output buffers are sized by the first minibatch, then the workers are forked
+    def launch(self, x, t):
+        self.mb_max = len(x)
+        self.x = self.shared(x.shape, x.dtype)
+        self.t = self.shared(t.shape, t.dtype)
+        out = self.model.inference(x[:1])
+        self.out = self.shared((len(x),) + out.shape[1:], out.dtype)
+
+        ctx = mp.get_context('fork')
+        for k in range(self.num_workers):
+            proc = ctx.Process(target=self.worker, args=(k,), daemon=True)
+            proc.start()
+            self.procs.append(proc)
+
+    def worker(self, k):
+        try:
+            grads = {}
+            offset = 0
+            for layer, name, _ in self.params:
+                param = getattr(layer, name)
+                grads[id(param)] = self.grads[k, offset: offset + param.size].reshape(param.shape)
+                offset += param.size
+            collector = GradientCollector(grads)
+            for layer in self.model.layers:
+                layer.set_optimizer(collector)
+
+            lo, hi = self.bounds[k], self.bounds[k + 1]
+            param_seg = self.flat[lo: hi]
+            grad_seg = np.empty_like(param_seg)
+
+            while True:
+                self.start.wait()
+                mb, stop = self.ctl
+                if stop:
+                    return
+
+                i0, i1 = mb * k // self.num_workers, mb * (k + 1) // self.num_workers
+                if i1 > i0:
+                    self.model.forward(self.x[i0: i1])
+                    self.model.backward(self.t[i0: i1])
+                    self.out[i0: i1] = self.model.output
+                else:
+                    self.grads[k] = 0
+                self.reduce.wait()
+
+                np.sum(self.grads[:, lo: hi], axis=0, out=grad_seg)
+                self.optimizer.update(param_seg, grad_seg)
+                self.done.wait()
+        except BaseException:
+            self.start.abort()
+            self.done.abort()
+            self.reduce.abort()
+            raise
+
+    # one training step on the minibatch (x, t), afterwards model.output holds its outputs so that
+    # model.loss(t) works as after model.forward / backward
+    def step(self, x, t):
+        if len(self.procs) == 0:
+            self.launch(x, t)
+        if len(x) > self.mb_max:
+            raise Exception('invalid minibatch size >> ', len(x), 'should be <=', self.mb_max)
+
+        mb = len(x)
+        self.x[:mb] = x
+        self.t[:mb] = t
+        self.ctl[0], self.ctl[1] = mb, 0
+
+        self.start.wait()
+        self.done.wait()
+        self.model.output = self.out[:mb]
+
+    # stops the workers and gives the layers private copies of the parameters again
+    def close(self):
+        if len(self.procs) > 0:
+            self.ctl[1] = 1
+            try:
+                self.start.wait()
+            except threading.BrokenBarrierError:
+                pass
+            for proc in self.procs:
+                proc.join()
+            self.procs = []
+
+        for layer, name, _ in self.params:
+            setattr(layer, name, getattr(layer, name).copy())
+        if hasattr(self.model, 'output'):
+            self.model.output = np.array(self.model.output)
+        self.params = []
+        self.flat = self.grads = self.x = self.t = self.out = None
+
+        for shm in self.shm:
+            shm.close()
+            shm.unlink()
+        self.shm = []
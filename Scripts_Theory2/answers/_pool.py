@@ -0,0 +1,84 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from _conv import get_out_size
+
+
+def _pad(x, pad):
+    if pad > 0:
+        x = np.pad(x, ((0, 0), (0, 0), (pad, pad), (pad, pad)))
+    return x
+
+
+# zero-copy window view : [mb, c, h, w] -> [mb, c, out_h, out_w, k, k]
+def pool_view(x, k_size=2, stride=2):
+    mb, c, height, width = x.shape
+    out_height, out_width = get_out_size(height, width, k_size, stride=stride)
+    s_mb, s_c, s_h, s_w = x.strides
+
+    return as_strided(x, shape=(mb, c, out_height, out_width, k_size, k_size),
+                      strides=(s_mb, s_c, s_h * stride, s_w * stride, s_h, s_w),
+                      writeable=False)
+
+
+# returns the pooled output and the argmax inside each k x k window (row-major, ky * k + kx)
+def max_pool2d(x, k_size=2, stride=2, pad=0):
+    windows = pool_view(_pad(x, pad), k_size=k_size, stride=stride)
+
+    # reduce over the k * k window positions, each one is a strided view of the whole batch
+    out = windows[..., 0, 0].copy()
+    ind = np.zeros(out.shape, dtype=np.uint8 if k_size * k_size <= 256 else np.int64)
+    mask = np.empty(out.shape, dtype=bool)
+
+    for i in range(1, k_size * k_size):
+        v = windows[..., i // k_size, i % k_size]
+        np.greater(v, out, out=mask)
+        np.maximum(out, v, out=out)
+        # i only grows, so the newest winner is always the largest index
+        np.maximum(ind, mask * ind.dtype.type(i), out=ind)
+
+    return out, ind
+
+
+def ave_pool2d(x, k_size=2, stride=2, pad=0):
+    windows = pool_view(_pad(x, pad), k_size=k_size, stride=stride)
+
+    out = windows[..., 0, 0].astype(np.result_type(x.dtype, np.float32))
+    for i in range(1, k_size * k_size):
+        out += windows[..., i // k_size, i % k_size]
+    out /= k_size * k_size
+
+    return out
+
+
+# scatter dout back to the argmax positions recorded by max_pool2d
+def max_pool2d_backward(dout, ind, x_shape, k_size=2, stride=2, pad=0):
+    mb, c, height, width = x_shape
+    out_height, out_width = dout.shape[-2:]
+    dx = np.zeros((mb, c, height + pad * 2, width + pad * 2), dtype=dout.dtype)
+    mask = np.empty(ind.shape, dtype=bool)
+    grad = np.empty_like(dout)
+
+    for ky in range(k_size):
+        y_max = ky + stride * out_height
+        for kx in range(k_size):
+            x_max = kx + stride * out_width
+            np.equal(ind, ky * k_size + kx, out=mask)
+            np.multiply(dout, mask, out=grad)
+            dx[..., ky: y_max: stride, kx: x_max: stride] += grad
+
+    return dx[..., pad: pad + height, pad: pad + width]
+
+
+def ave_pool2d_backward(dout, x_shape, k_size=2, stride=2, pad=0):
+    mb, c, height, width = x_shape
+    out_height, out_width = dout.shape[-2:]
+    dx = np.zeros((mb, c, height + pad * 2, width + pad * 2), dtype=dout.dtype)
+    dout = dout / (k_size * k_size)
+
+    for ky in range(k_size):
+        y_max = ky + stride * out_height
+        for kx in range(k_size):
+            x_max = kx + stride * out_width
+            dx[..., ky: y_max: stride, kx: x_max: stride] += dout
+
+    return dx[..., pad: pad + height, pad: pad + width]
@@ -0,0 +1,133 @@
+import time
+import tracemalloc
+
+
+# estimated floating point operations of one layer call, as (gemm, elementwise).
+# read from the shapes the layer kept in its last forward, so it is only called after the layer ran
+def estimate_flops(layer, phase, w_pro=None):
+    name = type(layer).__name__
+
+    if name == 'FullyConnectedLayer':
+        mb, (in_n, out_n) = len(layer.x_out), layer.w.shape
+        act = 0 if layer.activation is None else 4 * mb * out_n
+        if phase == 'forward':
+            return 2 * mb * in_n * out_n, mb * out_n + act
+        gemm = 2 * mb * in_n * out_n
+        if w_pro is not None:
+            gemm += 2 * mb * w_pro.shape[0] * w_pro.shape[1]
+        # activation derivative, bias gradient, w / b update
+        return gemm, act + mb * out_n + 2 * (in_n + 1) * out_n
+
+    if name == 'ConvLayer':
+        out_c = len(layer.w)
+        col_n = layer.w[0].size
+        out_size = layer.x_out[:, 0].size
+        act = 0 if layer.activation is None else 4 * out_c * out_size
+        gemm = 2 * out_c * col_n * out_size
+        if phase == 'forward':
+            return gemm, out_c * out_size + act
+        if layer.need_grad_in:
+            gemm *= 2
+        if w_pro is not None:
+            gemm += 2 * len(layer.x_out) * w_pro.shape[0] * w_pro.shape[1]
+        return gemm, act + out_c * out_size + 2 * (col_n + 1) * out_c
+
+    if name == 'PoolLayer':
+        # one compare / add per window element, and the scatter back
+        gemm = 0
+        if phase == 'backward' and w_pro is not None:
+            gemm = 2 * len(layer.x_out) * w_pro.shape[0] * w_pro.shape[1]
+        return gemm, layer.x_out.size * layer.k_size * layer.k_size
+
+    return 0, 0
+
+
+# opt-in per layer and phase timing for Model : model.set_profiler(Profiler()).
+# Model only checks the profiler once per layer call, so a Model without one runs as before.
+# memory=True also records the peak bytes numpy allocates inside each call (through tracemalloc,
+# which slows every allocation down, so the times of such a run are only roughly comparable).
+# layers can split their call further with lap (FullyConnectedLayer : gemm, activation, update),
+# these show up as sub rows below the phase, e.g. forward.gemm
+class Profiler():
+    header = ['layer', 'phase', 'calls', 'total ms', 'ms/call', '%', 'gemm MFLOP', 'other MFLOP', 'GFLOP/s', 'alloc KB']
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = {}
+        # the (ind, phase) of the running call, and the sub-phases laps recorded for it
+        self.current = None
+        self.subs = {}
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def call(self, ind, layer, phase, func, *args, **kwargs):
+        if self.memory:
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+
+        key = (ind, phase)
+        self.current = key
+        t = time.perf_counter()
+        out = func(*args, **kwargs)
+        t = time.perf_counter() - t
+        self.current = None
+
+        alloc = 0
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            alloc = peak - current
+
+        gemm, elementwise = estimate_flops(layer, phase, w_pro=kwargs.get('w_pro'))
+
+        record = self.records.get(key)
+        if record is None:
+            record = {'layer': '{}:{}'.format(ind, type(layer).__name__), 'phase': phase,
+                      'calls': 0, 'time': 0., 'gemm': 0, 'elementwise': 0, 'alloc': 0}
+            self.records[key] = record
+        record['calls'] += 1
+        record['time'] += t
+        record['gemm'] += gemm
+        record['elementwise'] += elementwise
+        record['alloc'] += alloc
+
+        return out
+
+    # adds the time since t (and gemm flops) to the sub-phase name of the running call, returns the new t.
+    # outside of call (e.g. Model.predict) it only returns the time
+    def lap(self, name, t, gemm=0):
+        now = time.perf_counter()
+        if self.current is not None:
+            sub = self.subs.setdefault(self.current, {}).setdefault(name, [0., 0])
+            sub[0] += now - t
+            sub[1] += gemm
+        return now
+
+    def reset(self):
+        self.records = {}
+        self.subs = {}
+
+    def rows(self):
+        total = sum(r['time'] for r in self.records.values())
+        rows = []
+        for key in sorted(self.records, key=lambda k: (k[1] != 'forward', k[0])):
+            r = self.records[key]
+            calls = r['calls']
+            rows.append([r['layer'], r['phase'], calls, r['time'] * 1e3, r['time'] / calls * 1e3,
+                         r['time'] / total * 100, r['gemm'] / calls / 1e6, r['elementwise'] / calls / 1e6,
+                         (r['gemm'] + r['elementwise']) / r['time'] / 1e9, r['alloc'] / calls / 1024])
+            for name, (t, gemm) in self.subs.get(key, {}).items():
+                rows.append(['', '{}.{}'.format(r['phase'], name), calls, t * 1e3, t / calls * 1e3,
+                             t / total * 100, gemm / calls / 1e6, 0., gemm / max(t, 1e-12) / 1e9, 0.])
+        return rows
+
+    def table(self):
+        lines = ['{:24s} {:20s} {:>6s} {:>10s} {:>8s} {:>6s} {:>11s} {:>12s} {:>8s} {:>9s}'.format(*self.header)]
+        for row in self.rows():
+            lines.append('{:24s} {:20s} {:6d} {:10.1f} {:8.3f} {:6.1f} {:11.2f} {:12.3f} {:8.2f} {:9.1f}'.format(*row))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            f.write(','.join(self.header) + '\n')
+            for row in self.rows():
+                f.write(','.join(str(v) for v in row) + '\n')
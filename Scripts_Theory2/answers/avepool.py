@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
+from _pool import ave_pool2d
 
 height, width = 64, 64
 
@@ -14,19 +15,8 @@ k_size = 2
 stride = 2
 pad = 0
 
-pad_img = np.zeros((pad * 2 + height, pad * 2 + width, in_c), np.float32)
-pad_img[pad: pad+height, pad: pad+width] = img
-
-out_height = (height + pad) // stride
-out_width = (width + pad) // stride
-
-out = np.zeros((out_height, out_width, in_c), dtype=np.float32)
-
-for y in range(out_height):
-    for x in range(out_width):
-        for c in range(in_c):
-            out[y, x, c] = np.mean(pad_img[y * stride: y * stride + k_size,
-                                           x * stride: x * stride + k_size, c])
+out = ave_pool2d(img.transpose(2, 0, 1)[None], k_size=k_size, stride=stride, pad=pad)
+out = out[0].transpose(1, 2, 0)
 
 for i in range(in_c):
     plt.subplot(1,in_c,i+1)
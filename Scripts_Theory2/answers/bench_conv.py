@@ -0,0 +1,53 @@
+import numpy as np
+import time
+from _conv import conv2d
+
+np.random.seed(0)
+
+height, width = 64, 64
+in_c = 3
+k_channel = 4
+k_size = 3
+
+
+# per-pixel loop version of conv_kernel.py / conv_pad.py / conv_stride.py
+def conv2d_loop(img, kernels, stride=1, pad=0):
+    _c, _h, _w = img.shape
+    pad_img = np.zeros((_c, pad * 2 + _h, pad * 2 + _w), np.float32)
+    pad_img[..., pad: pad+_h, pad: pad+_w] = img
+
+    out_height = (_h + pad * 2 - k_size) // stride + 1
+    out_width = (_w + pad * 2 - k_size) // stride + 1
+    out = np.zeros((len(kernels), out_height, out_width), dtype=np.float32)
+
+    for y in range(out_height):
+        for x in range(out_width):
+            for ki in range(len(kernels)):
+                out[ki, y, x] = np.sum(pad_img[..., y * stride: y * stride + k_size,
+                                               x * stride: x * stride + k_size] * kernels[ki])
+    return out
+
+
+def timeit(f, n=5):
+    f()
+    t = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - t) / n
+
+
+kernels = np.random.normal(0, 0.01, [k_channel, k_size, k_size])
+
+for mb in [1, 16]:
+    xs = np.random.rand(mb, in_c, height, width).astype(np.float32)
+
+    for name, stride, pad in [('kernel', 1, 0), ('pad', 1, 1), ('stride', 2, 1)]:
+        out = conv2d(xs, kernels, stride=stride, pad=pad)
+        out_loop = np.array([conv2d_loop(x, kernels, stride=stride, pad=pad) for x in xs])
+        assert np.allclose(out, out_loop, atol=1e-5), name
+
+        t_loop = timeit(lambda: [conv2d_loop(x, kernels, stride=stride, pad=pad) for x in xs], n=1)
+        t_im2col = timeit(lambda: conv2d(xs, kernels, stride=stride, pad=pad))
+
+        print("mb: {:3d} conv_{:6s} >> loop: {:9.3f} ms, im2col: {:7.3f} ms, x{:.0f}".format(
+            mb, name, t_loop * 1000, t_im2col * 1000, t_loop / t_im2col))
@@ -0,0 +1,48 @@
+import numpy as np
+import time
+from _neuralnet import sigmoid, FullyConnectedLayer, ConvLayer, PoolLayer, Model, data_load
+
+img_height, img_width = 64, 64
+mb = 64
+iteration = 500
+
+
+def make_mlp(**kwargs):
+    return Model(FullyConnectedLayer(in_n=img_height * img_width * 3, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1, **kwargs)
+
+def make_cnn(**kwargs):
+    return Model(ConvLayer(in_c=3, out_c=8, k_size=4, stride=4, activation=sigmoid),
+                 PoolLayer(k_size=2, stride=2),
+                 ConvLayer(in_c=8, out_c=16, k_size=3, pad=1, activation=sigmoid),
+                 PoolLayer(k_size=2, stride=2),
+                 FullyConnectedLayer(in_n=16 * (img_height // 16) * (img_width // 16), out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1, **kwargs)
+
+
+xs, ts, _ = data_load("../Dataset/train/images/", hf=True, vf=True)
+test_xs, test_ts, _ = data_load("../Dataset/test/images/")
+
+for name, make_model, flatten in [('mlp', make_mlp, True), ('cnn', make_cnn, False)]:
+    for policy in [{}, {'dtype': np.float32}, {'dtype': np.float32, 'master': True}]:
+        np.random.seed(0)
+        model = make_model(**policy)
+        train_ind = np.random.randint(0, len(xs), [iteration, mb])
+
+        t = time.perf_counter()
+        for ite in range(iteration):
+            x = xs[train_ind[ite]]
+            if flatten:
+                x = x.reshape(mb, -1)
+            model.forward(x)
+            model.backward(ts[train_ind[ite]])
+        t = time.perf_counter() - t
+
+        loss = model.loss(ts[train_ind[-1]])
+        x = test_xs.reshape(len(test_xs), -1) if flatten else test_xs
+        accuracy = np.mean((model.forward(x) > 0.5) == test_ts)
+
+        print("{} {:32s} >> {:6.2f} ms / ite, last loss: {:.4f}, test accuracy: {:.2f}, weight dtype: {}".format(
+            name, str({k: getattr(v, '__name__', v) for k, v in policy.items()}) if policy else 'default (float64 weights)',
+            t / iteration * 1000, loss, accuracy, model.layers[0].w.dtype))
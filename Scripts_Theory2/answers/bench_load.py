@@ -0,0 +1,24 @@
+import numpy as np
+import os
+import time
+from _neuralnet import data_load
+
+path = "../Dataset/train/images/"
+repeat = 5
+
+outputs = {}
+
+print('cpu count >>', os.cpu_count())
+
+for num_workers in [0, 2, 4, 8, -1]:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        xs, ts, paths = data_load(path, num_workers=num_workers)
+    t = (time.perf_counter() - t) / repeat
+
+    outputs[num_workers] = xs
+    print('num_workers {:>2} : {:.1f} ms / load, {:.0f} images/sec'.format(num_workers, t * 1e3, len(xs) / t))
+
+# workers only change the schedule, never the result or its order
+for num_workers, xs in outputs.items():
+    assert np.array_equal(xs, outputs[0]), num_workers
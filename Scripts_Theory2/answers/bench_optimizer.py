@@ -0,0 +1,58 @@
+import numpy as np
+import time
+from _neuralnet import sigmoid, FullyConnectedLayer, Model, AugmentDataset, MinibatchSampler, data_load
+from _optimizer import SGD, Momentum, Adam
+
+img_height, img_width = 64, 64
+mb = 64
+iteration = 1000
+target_loss = 0.02
+# loss is averaged over this many iterations before it is compared with target_loss
+window = 20
+
+
+def make_model(optimizer, dtype=None):
+    np.random.seed(0)
+    return Model(FullyConnectedLayer(in_n=img_height * img_width * 3, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid),
+                 lr=0.1, optimizer=optimizer, workspace=True, dtype=dtype)
+
+
+train = AugmentDataset("../Dataset/train/images/", hf=True, vf=True, rot=1, cache_dir=".cache")
+test_xs, test_ts, _ = data_load("../Dataset/test/images/", cache_dir=".cache")
+
+# the same batches for every optimizer, gathered up front so only the model is timed
+sampler = MinibatchSampler(len(train), mb, fetch=train.__getitem__, seed=0)
+batches = [sampler() for _ in range(iteration)]
+
+for name, optimizer, dtype in [('sgd lr=0.1 (default)', None, None),
+                               ('sgd lr=0.001', SGD(lr=0.001), None),
+                               ('momentum lr=0.01', Momentum(lr=0.01, momentum=0.9), None),
+                               ('adam lr=0.001', Adam(lr=0.001), None),
+                               ('momentum lr=0.01 float32', Momentum(lr=0.01, momentum=0.9), np.float32),
+                               ('adam lr=0.001 float32', Adam(lr=0.001), np.float32)]:
+    model = make_model(optimizer, dtype=dtype)
+    losses = np.zeros(iteration)
+    times = np.zeros(iteration)
+    hit = None
+
+    t = time.perf_counter()
+    for ite, (x, t_) in enumerate(batches):
+        model.forward(x.reshape(mb, -1))
+        model.backward(t_)
+        losses[ite] = model.loss(t_)
+        times[ite] = time.perf_counter() - t
+
+        if hit is None and ite >= window and losses[ite - window + 1: ite + 1].mean() < target_loss:
+            hit = ite
+
+    accuracy = np.mean((model.inference(test_xs) > 0.5) == test_ts)
+
+    if hit is None:
+        reached = 'not reached in {} ite'.format(iteration)
+    else:
+        reached = 'ite {:4d} , {:5.2f} s'.format(hit + 1, times[hit])
+
+    print("{:26s} >> {:5.2f} ms / ite, loss < {} : {}, final loss: {:.4f}, test accuracy: {:.2f}".format(
+        name, times[-1] / iteration * 1000, target_loss, reached, losses[-window:].mean(), accuracy))
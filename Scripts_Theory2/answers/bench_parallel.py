@@ -0,0 +1,52 @@
+import os
+# one BLAS thread per process, the workers are the parallelism
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+import numpy as np
+import time
+from _neuralnet import sigmoid, FullyConnectedLayer, Model, data_load
+from _parallel import DataParallel
+
+img_height, img_width = 64, 64
+iteration = 50
+
+
+def make_model():
+    np.random.seed(0)
+    return Model(FullyConnectedLayer(in_n=img_height * img_width * 3, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.01, workspace=True)
+
+
+xs, ts, _ = data_load("../Dataset/train/images/", hf=True, vf=True, cache_dir=".cache")
+xs = xs.reshape(len(xs), -1)
+
+print('cpu count >>', os.cpu_count())
+
+for mb in [256, 1024]:
+    np.random.seed(0)
+    inds = np.random.randint(0, len(xs), [iteration, mb])
+
+    model = make_model()
+    t = time.perf_counter()
+    for ind in inds:
+        model.forward(xs[ind])
+        model.backward(ts[ind])
+    t = time.perf_counter() - t
+    print('mb {:4d} serial        >> {:8.0f} samples/sec, loss {:.4f}'.format(mb, iteration * mb / t, model.loss(ts[ind])))
+
+    for num_workers in [1, 2, 4, -1]:
+        model = make_model()
+        parallel = DataParallel(model, num_workers=num_workers)
+        # the first step forks the workers
+        parallel.step(xs[inds[0]], ts[inds[0]])
+
+        t = time.perf_counter()
+        for ind in inds[1:]:
+            parallel.step(xs[ind], ts[ind])
+        t = time.perf_counter() - t
+        loss = model.loss(ts[ind])
+        parallel.close()
+
+        print('mb {:4d} workers {:>2}    >> {:8.0f} samples/sec, loss {:.4f}'.format(
+            mb, num_workers, (iteration - 1) * mb / t, loss))
@@ -0,0 +1,63 @@
+import numpy as np
+import time
+from _pool import max_pool2d, ave_pool2d, max_pool2d_backward, ave_pool2d_backward
+
+np.random.seed(0)
+
+k_size = 2
+stride = 2
+
+
+# per-pixel loop version of maxpool.py / avepool.py
+def pool_loop(x, f):
+    mb, c, height, width = x.shape
+    out_height = (height - k_size) // stride + 1
+    out_width = (width - k_size) // stride + 1
+    out = np.zeros((mb, c, out_height, out_width), dtype=np.float32)
+
+    for n in range(mb):
+        for y in range(out_height):
+            for _x in range(out_width):
+                for _c in range(c):
+                    out[n, _c, y, _x] = f(x[n, _c, y * stride: y * stride + k_size,
+                                              _x * stride: _x * stride + k_size])
+    return out
+
+
+def timeit(f, n=5):
+    f()
+    t = time.perf_counter()
+    for _ in range(n):
+        f()
+    return (time.perf_counter() - t) / n
+
+
+# check against the loop version and the numerical gradient
+xs = np.random.rand(2, 3, 16, 16).astype(np.float32)
+out, ind = max_pool2d(xs, k_size=k_size, stride=stride)
+assert np.allclose(out, pool_loop(xs, np.max))
+assert np.allclose(ave_pool2d(xs, k_size=k_size, stride=stride), pool_loop(xs, np.mean))
+
+dout = np.random.rand(*out.shape).astype(np.float32)
+dx = max_pool2d_backward(dout, ind, xs.shape, k_size=k_size, stride=stride)
+assert np.isclose(dx.sum(), dout.sum()) and np.count_nonzero(dx) == dout.size
+dx = ave_pool2d_backward(dout, xs.shape, k_size=k_size, stride=stride)
+assert np.isclose(dx.sum(), dout.sum())
+
+# throughput
+for mb, c, size in [(64, 3, 64), (256, 32, 32), (1024, 16, 32)]:
+    xs = np.random.rand(mb, c, size, size).astype(np.float32)
+    out, ind = max_pool2d(xs, k_size=k_size, stride=stride)
+    dout = np.ones_like(out)
+
+    t_max = timeit(lambda: max_pool2d(xs, k_size=k_size, stride=stride))
+    t_ave = timeit(lambda: ave_pool2d(xs, k_size=k_size, stride=stride))
+    t_max_b = timeit(lambda: max_pool2d_backward(dout, ind, xs.shape, k_size=k_size, stride=stride))
+
+    print("feature maps: {:6d} ({}x{}) >> max: {:7.2f} ms, ave: {:7.2f} ms, max backward: {:7.2f} ms".format(
+        mb * c, size, size, t_max * 1000, t_ave * 1000, t_max_b * 1000))
+
+xs = np.random.rand(4, 3, 64, 64).astype(np.float32)
+t_loop = timeit(lambda: pool_loop(xs, np.max), n=1)
+t_max = timeit(lambda: max_pool2d(xs, k_size=k_size, stride=stride))
+print("loop vs strided (4x3x64x64) >> loop: {:.2f} ms, strided: {:.3f} ms, x{:.0f}".format(t_loop * 1000, t_max * 1000, t_loop / t_max))
@@ -0,0 +1,60 @@
+import numpy as np
+import time
+from _neuralnet import sigmoid, FullyConnectedLayer, ConvLayer, PoolLayer, Model, data_load
+from _profile import Profiler
+
+img_height, img_width = 64, 64
+mb = 64
+iteration = 200
+
+
+def make_mlp(**kwargs):
+    return Model(FullyConnectedLayer(in_n=img_height * img_width * 3, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1, **kwargs)
+
+def make_cnn(**kwargs):
+    return Model(ConvLayer(in_c=3, out_c=8, k_size=4, stride=4, activation=sigmoid),
+                 PoolLayer(k_size=2, stride=2),
+                 ConvLayer(in_c=8, out_c=16, k_size=3, pad=1, activation=sigmoid),
+                 PoolLayer(k_size=2, stride=2),
+                 FullyConnectedLayer(in_n=16 * (img_height // 16) * (img_width // 16), out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1, **kwargs)
+
+
+def train(model, xs, ts, flatten):
+    np.random.seed(0)
+    train_ind = np.random.randint(0, len(xs), [iteration, mb])
+
+    t = time.perf_counter()
+    for ite in range(iteration):
+        x = xs[train_ind[ite]]
+        if flatten:
+            x = x.reshape(mb, -1)
+        model.forward(x)
+        model.backward(ts[train_ind[ite]])
+    return (time.perf_counter() - t) / iteration * 1000
+
+
+xs, ts, _ = data_load("../Dataset/train/images/", hf=True, vf=True, cache_dir=".cache")
+
+for name, make_model, flatten in [('mlp', make_mlp, True), ('mlp float32 workspace', lambda: make_mlp(dtype=np.float32, workspace=True), True),
+                                  ('cnn', make_cnn, False)]:
+    np.random.seed(0)
+    model = make_model()
+    off = train(model, xs, ts, flatten)
+
+    profiler = Profiler()
+    model.set_profiler(profiler)
+    on = train(model, xs, ts, flatten)
+
+    # a separate pass for the allocations, tracemalloc slows the timed run down
+    model.set_profiler(Profiler(memory=True))
+    train(model, xs, ts, flatten)
+    for key, record in model.profiler.records.items():
+        profiler.records[key]['alloc'] = record['alloc']
+
+    print('{} >> {:.2f} ms / ite without profiler, {:.2f} ms / ite with'.format(name, off, on))
+    profiler.save('profile_{}.csv'.format(name.replace(' ', '_')))
+    print(profiler.table())
+    print()
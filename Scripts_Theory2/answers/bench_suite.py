@@ -0,0 +1,133 @@
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import time
+from _conv import conv2d
+from _pool import max_pool2d, ave_pool2d, max_pool2d_backward, ave_pool2d_backward
+from _neuralnet import sigmoid, FullyConnectedLayer
+
+# times the Theory2 building blocks over a grid of batch sizes, image sizes and channel counts.
+#   python bench_suite.py --save baseline.json                 # record a baseline
+#   python bench_suite.py --save new.json --baseline baseline.json   # compare against it
+parser = argparse.ArgumentParser()
+parser.add_argument('--save', default='bench_suite.json', help='where to write the results')
+parser.add_argument('--baseline', default=None, help='results of an earlier run to compare with')
+parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported as a regression / speedup')
+parser.add_argument('--min_time', type=float, default=0.05, help='seconds each measurement runs at least')
+parser.add_argument('--quick', action='store_true', help='only the smallest grid')
+args = parser.parse_args()
+
+mbs = [1, 16, 64]
+sizes = [32, 64]
+channels = [3, 16]
+if args.quick:
+    mbs, sizes, channels = [16], [32], [3]
+
+k_channel = 16
+k_size = 3
+fc_out_n = 64
+dtype = np.float32
+
+
+# best of 3 runs, each repeating f until it took min_time
+def timeit(f, min_time):
+    f()
+    n = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(n):
+            f()
+        t = time.perf_counter() - t
+        if t >= min_time:
+            break
+        n = max(n * 2, int(n * min_time / max(t, 1e-9)))
+
+    best = t / n
+    for _ in range(2):
+        t = time.perf_counter()
+        for _ in range(n):
+            f()
+        best = min(best, (time.perf_counter() - t) / n)
+    return best
+
+
+# {name : f} for one point of the grid
+def make_ops(mb, c, size):
+    xs = np.random.rand(mb, c, size, size).astype(dtype)
+    kernels = np.random.normal(0, 0.01, [k_channel, c, k_size, k_size]).astype(dtype)
+
+    out, ind = max_pool2d(xs)
+    dout = np.random.rand(*out.shape).astype(dtype)
+
+    fc = FullyConnectedLayer(in_n=c * size * size, out_n=fc_out_n, activation=sigmoid)
+    # the N(0, 1) init saturates sigmoid (and overflows exp) with inputs this wide
+    fc.w /= np.sqrt(c * size * size)
+    fc.set_dtype(dtype)
+    # small enough that the repeated updates leave the weights where they are
+    fc.set_lr(1e-8)
+    fc.set_optimizer(None)
+    fc_x = xs.reshape(mb, -1)
+    fc_grad = np.random.rand(mb, fc_out_n).astype(dtype)
+    fc.forward(fc_x)
+
+    return {'conv_kernel': lambda: conv2d(xs, kernels, stride=1, pad=0),
+            'conv_pad': lambda: conv2d(xs, kernels, stride=1, pad=1),
+            'conv_stride': lambda: conv2d(xs, kernels, stride=2, pad=1),
+            'maxpool': lambda: max_pool2d(xs),
+            'maxpool_backward': lambda: max_pool2d_backward(dout, ind, xs.shape),
+            'avepool': lambda: ave_pool2d(xs),
+            'avepool_backward': lambda: ave_pool2d_backward(dout, xs.shape),
+            'fc_forward': lambda: fc.forward(fc_x),
+            'fc_backward': lambda: fc.backward(None, fc_grad)}
+
+
+def key(r):
+    return '{} mb={} c={} size={}'.format(r['op'], r['mb'], r['c'], r['size'])
+
+
+np.random.seed(0)
+
+results = []
+print('{:40s} {:>10s} {:>12s} {:>12s}'.format('op', 'ms', 'ops/sec', 'images/sec'))
+for mb in mbs:
+    for c in channels:
+        for size in sizes:
+            for op, f in make_ops(mb, c, size).items():
+                t = timeit(f, args.min_time)
+                r = {'op': op, 'mb': mb, 'c': c, 'size': size,
+                     'ms': t * 1e3, 'ops_per_sec': 1 / t, 'images_per_sec': mb / t}
+                results.append(r)
+                print('{:40s} {:10.3f} {:12.1f} {:12.1f}'.format(key(r), r['ms'], r['ops_per_sec'], r['images_per_sec']))
+
+meta = {'numpy': np.__version__, 'python': platform.python_version(), 'machine': platform.machine(),
+        'cpu_count': os.cpu_count(), 'dtype': np.dtype(dtype).name, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+with open(args.save, 'w') as f:
+    json.dump({'meta': meta, 'results': results}, f, indent=1)
+print('saved >>', args.save)
+
+if args.baseline is not None:
+    with open(args.baseline) as f:
+        baseline = {key(r): r for r in json.load(f)['results']}
+
+    # speedup > 1 : faster than the baseline
+    print()
+    print('{:40s} {:>10s} {:>10s} {:>8s}'.format('compared with ' + args.baseline, 'base ms', 'ms', 'speedup'))
+    speedups = []
+    for r in results:
+        base = baseline.get(key(r))
+        if base is None:
+            continue
+        speedup = base['ms'] / r['ms']
+        speedups.append(speedup)
+        mark = ''
+        if speedup < 1 - args.threshold:
+            mark = 'regression'
+        elif speedup > 1 + args.threshold:
+            mark = 'speedup'
+        print('{:40s} {:10.3f} {:10.3f} {:8.2f} {}'.format(key(r), base['ms'], r['ms'], speedup, mark))
+
+    if len(speedups) > 0:
+        print('geometric mean speedup over {} measurements >> {:.3f}'.format(
+            len(speedups), np.exp(np.mean(np.log(speedups)))))
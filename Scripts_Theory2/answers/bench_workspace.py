@@ -0,0 +1,50 @@
+import numpy as np
+import time
+import tracemalloc
+from _neuralnet import sigmoid, FullyConnectedLayer, Model
+
+img_height, img_width = 64, 64
+mb = 64
+iteration = 1000
+
+
+def make_model(workspace):
+    np.random.seed(0)
+    return Model(FullyConnectedLayer(in_n=img_height * img_width * 3, out_n=64, activation=sigmoid),
+                 FullyConnectedLayer(in_n=64, out_n=32, activation=sigmoid),
+                 FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1, workspace=workspace)
+
+
+np.random.seed(0)
+xs = np.random.rand(mb * 4, img_height * img_width * 3).astype(np.float32)
+ts = np.random.randint(0, 2, [mb * 4, 1])
+batches = [(xs[i * mb: (i + 1) * mb], ts[i * mb: (i + 1) * mb]) for i in range(4)]
+
+outputs = {}
+
+for workspace in [False, True]:
+    model = make_model(workspace)
+
+    # temporaries created by one iteration (numpy reports its buffers to tracemalloc)
+    model.forward(batches[0][0])
+    model.backward(batches[0][1])
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    model.forward(batches[1][0])
+    model.backward(batches[1][1])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    t = time.perf_counter()
+    for ite in range(iteration):
+        x, _t = batches[ite % 4]
+        model.forward(x)
+        model.backward(_t)
+    t = time.perf_counter() - t
+
+    outputs[workspace] = model.forward(xs[:mb]).copy()
+    print("workspace: {:5} >> {:.1f} s / {} iterations ({:.2f} ms / ite), temporary memory per ite: {:.1f} KB".format(
+        str(workspace), t, iteration, t / iteration * 1000, (peak - before) / 1024))
+
+print("max diff between the two modes >>", np.abs(outputs[False] - outputs[True]).max())
@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
+from _conv import conv2d
 
 height, width = 64, 64
 
@@ -15,16 +16,9 @@ k_channel = 4
 k_size = 3
 kernels = np.random.normal(0, 0.01, [k_channel, k_size, k_size])
 
-out = np.zeros((k_channel, height, width), dtype=np.float32)
+pad = k_size // 2
 
-pad = np.floor(k_size / 2).astype(np.int)
-pad_img = np.zeros((in_c, pad * 2 + height, pad * 2 + width), np.float32)
-pad_img[..., pad: pad+height, pad: pad+width] = img
-
-for y in range(height):
-    for x in range(width):
-        for ki in range(k_channel):
-            out[ki, y, x] = np.sum(pad_img[..., y:y+3, x:x+3] * kernels[ki])
+out = conv2d(img, kernels, stride=1, pad=pad)
 
 for i in range(k_channel):
     plt.subplot(1,k_channel,i+1)
@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
+from _conv import conv2d
 
 height, width = 64, 64
 
@@ -16,20 +17,9 @@ k_size = 3
 stride = 2
 kernels = np.random.normal(0, 0.01, [k_channel, k_size, k_size])
 
-pad = np.floor(k_size / 2).astype(np.int)
-pad_img = np.zeros((in_c, pad * 2 + height, pad * 2 + width), np.float32)
-pad_img[..., pad: pad+height, pad: pad+width] = img
+pad = k_size // 2
 
-out_height = (height + pad) // stride
-out_width = (width + pad) // stride
-
-out = np.zeros((k_channel, out_height, out_width), dtype=np.float32)
-
-for y in range(out_height):
-    for x in range(out_width):
-        for ki in range(k_channel):
-            out[ki, y, x] = np.sum(pad_img[..., y * stride: y * stride + 3,
-                                           x * stride: x * stride + 3] * kernels[ki])
+out = conv2d(img, kernels, stride=stride, pad=pad)
 
 for i in range(k_channel):
     plt.subplot(1,k_channel,i+1)
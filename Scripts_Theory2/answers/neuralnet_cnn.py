@@ -0,0 +1,42 @@
+import numpy as np
+from _neuralnet import sigmoid, FullyConnectedLayer, ConvLayer, PoolLayer, Model, AugmentDataset, MinibatchSampler, data_load
+
+np.random.seed(0)
+
+num_classes = 2
+img_height, img_width = 64, 64
+
+
+# 64x64 -> 16x16 -> 8x8 -> 4x4, about 1/80 of the parameters of the MLP in neuralnet.py
+model = Model(ConvLayer(in_c=3, out_c=8, k_size=4, stride=4, activation=sigmoid),
+              PoolLayer(k_size=2, stride=2),
+              ConvLayer(in_c=8, out_c=16, k_size=3, pad=1, activation=sigmoid),
+              PoolLayer(k_size=2, stride=2),
+              FullyConnectedLayer(in_n=16 * (img_height // 16) * (img_width // 16), out_n=32, activation=sigmoid),
+              FullyConnectedLayer(in_n=32, out_n=1, activation=sigmoid), lr=0.1)
+
+train = AugmentDataset("../Dataset/train/images/", hf=True, vf=True, rot=1, cache_dir=".cache")
+
+mb = 64
+# gather + augmentation of the next batches runs on a background thread
+sampler = MinibatchSampler(len(train), mb, fetch=train.__getitem__, prefetch=4)
+
+for ite in range(1000):
+    x, t = sampler()
+
+    model.forward(x)
+    model.backward(t)
+    loss = model.loss(t)
+
+    if ite % 50 == 0:
+        print("ite:", ite+1, "Loss >>", loss)
+
+
+sampler.close()
+
+# test
+xs, ts, paths = data_load("../Dataset/test/images/", cache_dir=".cache")
+outs = model.inference(xs)
+
+for i in range(len(xs)):
+    print("in >>", paths[i], ", out >>", outs[i: i+1])
@@ -0,0 +1,15 @@
+import time
+from _neuralnet import Model, data_load
+
+# the model neuralnet.py trained and saved. the weights are memory-mapped, so this starts
+# in about a millisecond and every process running it shares the same pages
+t = time.perf_counter()
+model = Model.load("neuralnet.nnw", mmap=True)
+print("load >> {:.2f} ms".format((time.perf_counter() - t) * 1000))
+
+# test
+xs, ts, paths = data_load("../Dataset/test/images/", cache_dir=".cache")
+outs = model.inference(xs)
+
+for i in range(len(xs)):
+    print("in >>", paths[i], ", out >>", outs[i: i+1])
@@ -0,0 +1,76 @@
+import os
+import functools
+import numpy as np
+import cv2
+import torch
+from torch.utils.data import Dataset, DataLoader
+from _main_base_generative import data_load, get_image, image_cache, image_cache_bytes
+
+# torch Dataset over the data_load index : dataset[i] is one sample as numpy arrays, one per mode, made by get_image.
+#   GenerativeDataset(cfg, [cfg.INPUT_MODE])                                  ... (x,)
+#   GenerativeDataset(cfg, [cfg.INPUT_MODE, cfg.OUTPUT_MODE])                 ... (x, y) of the same image
+#   GenerativeDataset(cfg, [cfg.INPUT_MODE], gt_modes=[cfg.OUTPUT_MODE])      ... (x, y) with y from paths_gt
+# path_dict : the result of data_load(cfg), loaded here when None
+class GenerativeDataset(Dataset):
+    def __init__(self, cfg, modes, gt_modes=None, path_dict=None):
+        gt_modes = gt_modes or []
+        if path_dict is None:
+            path_dict = data_load(cfg)
+        self.cfg = cfg
+        self.fields = [(path_dict['paths'], mode) for mode in modes] + [(path_dict['paths_gt'], mode) for mode in gt_modes]
+        if len(self.fields) == 0:
+            raise Exception('invalid modes >> ', modes, gt_modes, 'should have at least one mode')
+
+    def __len__(self):
+        return len(self.fields[0][0])
+
+    def __getitem__(self, i):
+        return tuple(get_image(paths[[i]], self.cfg, mode)[0] for paths, mode in self.fields)
+
+
+# stacks the samples of GenerativeDataset into one tensor per mode : float32 images [mb, c, h, w]
+# (channel_axis=3 keeps [mb, h, w, c]) and CLASS_LABEL as uint8 [mb, h, w] class ids
+# (.long() or F.one_hot after moving them to the device)
+def collate(batch, channel_axis=1):
+    out = []
+    for xs in zip(*batch):
+        xs = np.stack(xs)
+        if xs.ndim == 4 and channel_axis == 1:
+            xs = xs.transpose(0, 3, 1, 2)
+        out.append(torch.from_numpy(np.ascontiguousarray(xs)))
+    return tuple(out)
+
+
+# every worker decodes its own samples, so cv2 should not start threads of its own.
+# a spawned worker imports _main_base_generative afresh, so the image_cache budget is set again here
+def worker_init(worker_id, cache_bytes=image_cache_bytes):
+    cv2.setNumThreads(0)
+    image_cache.set_max_bytes(cache_bytes)
+
+
+# DataLoader over dataset, decoding and augmenting in num_workers processes (-1 : one per cpu, 0 : in the
+# calling process) while the model computes. persistent_workers keeps the workers, and with them their
+# image_cache (up to cfg.IMAGE_CACHE_BYTES each), over epochs. every worker keeps prefetch_factor batches ready,
+# pin_memory (default : when cuda is available) puts them in page-locked memory for .to(device, non_blocking=True)
+def get_dataloader(dataset, cfg, mb, shuffle=True, num_workers=-1, persistent_workers=True, pin_memory=None, prefetch_factor=2, drop_last=True):
+    if num_workers < 0:
+        num_workers = os.cpu_count()
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    # DataLoader refuses these without workers
+    kwargs = {}
+    if num_workers > 0:
+        kwargs = {'persistent_workers': persistent_workers, 'prefetch_factor': prefetch_factor,
+                  'worker_init_fn': functools.partial(worker_init, cache_bytes=cfg.get('IMAGE_CACHE_BYTES', image_cache_bytes))}
+
+    return DataLoader(dataset, batch_size=mb, shuffle=shuffle, drop_last=drop_last, num_workers=num_workers,
+                      pin_memory=pin_memory, collate_fn=functools.partial(collate, channel_axis=cfg.get('CHANNEL_AXIS', 1)),
+                      **kwargs)
+
+
+# endless batches of loader, for loops counted in iterations instead of epochs
+def loop(loader):
+    while True:
+        for batch in loader:
+            yield batch
@@ -1,135 +1,414 @@
 from glob import glob
-from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import queue
+import threading
+import os
 import numpy as np
 import cv2
 
-# get train data
-def data_load(cfg):
+# sample index of data_load : one row per sample and augmentation in a structured array
+# (path id into the interned path table, hf, vf, rot), so indexing with a minibatch is one fancy index.
+# index[mb_ind] is an index of those rows (sharing the path table), index['path'] / index['rot'] ... a column,
+# and iterating gives the {'path', 'hf', 'vf', 'rot'} dicts get_image_one reads, built only for those rows
+sample_dtype = np.dtype([('path', np.int32), ('hf', np.uint8), ('vf', np.uint8), ('rot', np.int16)])
+
+class SampleIndex():
+    def __init__(self, table, samples):
+        self.table = table
+        self.samples = samples
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, ind):
+        if isinstance(ind, str):
+            if ind == 'path':
+                return self.table[self.samples['path']]
+            return self.samples[ind]
+        if np.isscalar(ind):
+            ind = [ind]
+        return SampleIndex(self.table, self.samples[ind])
+
+    def __iter__(self):
+        for path, hf, vf, rot in zip(self.table[self.samples['path']].tolist(), self.samples['hf'].tolist(),
+                                     self.samples['vf'].tolist(), self.samples['rot'].tolist()):
+            yield {'path': path, 'hf': bool(hf), 'vf': bool(vf), 'rot': rot}
+
+
+# get train data. hf / vf / rot default to cfg.TRAIN.DATA_*.
+# also sets the image_cache budget to cfg.IMAGE_CACHE_BYTES, get_image only reads it
+def data_load(cfg, hf=None, vf=None, rot=None):
+    image_cache.set_max_bytes(cfg.get('IMAGE_CACHE_BYTES', image_cache_bytes))
     path = cfg.TRAIN.DATA_PATH
-    hf = cfg.TRAIN.DATA_HORIZONTAL_FLIP
-    vf = cfg.TRAIN.DATA_VERTICAL_FLIP
-    rot = cfg.TRAIN.DATA_ROTATION
+    hf = cfg.TRAIN.DATA_HORIZONTAL_FLIP if hf is None else hf
+    vf = cfg.TRAIN.DATA_VERTICAL_FLIP if vf is None else vf
+    rot = cfg.TRAIN.DATA_ROTATION if rot is None else rot
 
     if (rot == 0) and (rot != False):
         raise Exception('invalid rot >> ', rot, 'should be [1, 359] or False')
 
-    paths = []
-    paths_gt = []
-    
-    data_num = 0
-    for dir_path in glob(path + '/*'):
-        data_num += len(glob(dir_path + "/*"))
-    
+    # one scan of the class directories
+    files = glob(path + '/*/*')
+
     print('Dataset >>', path)
-    print(' - Found data num >>', data_num)
+    print(' - Found data num >>', len(files))
     print(' - Horizontal >>', hf)
     print(' - Vertical >>', vf)
-    print(' - Rotation >>', rot)        
-    pbar = tqdm(total = data_num)
-    
-    for dir_path in glob(path + '/*'):
-        for path in glob(dir_path + '/*'):
-            for i, cls in enumerate(cfg.CLASS_LABEL):
-                if cls in path:
-                    t = i
-
-            paths.append({'path': path, 'hf': False, 'vf': False, 'rot': 0})
-            
-            gt_path = path.replace("images", "seg_images").replace(".jpg", ".png")
-            paths_gt.append({'path': gt_path, 'hf': False, 'vf': False, 'rot': 0})
-
-            # horizontal flip
-            if hf:
-                paths.append({'path': path, 'hf': True, 'vf': False, 'rot': 0})
-                paths_gt.append({'path': gt_path, 'hf': True, 'vf': False, 'rot': 0})
-            # vertical flip
-            if vf:
-                paths.append({'path': path, 'hf': False, 'vf': True, 'rot': 0})
-                paths_gt.append({'path': gt_path, 'hf': False, 'vf': True, 'rot': 0})
-            # horizontal and vertical flip
-            if hf and vf:
-                paths.append({'path': path, 'hf': True, 'vf': True, 'rot': 0})
-                paths_gt.append({'path': gt_path, 'hf': True, 'vf': True, 'rot': 0})
-            # rotation
-            if rot is not False:
-                angle = rot
-                while angle < 360:
-                    paths.append({'path': path, 'hf': False, 'vf': False, 'rot': rot})
-                    paths_gt.append({'path': gt_path, 'hf': False, 'vf': False, 'rot': rot})
-                    angle += rot
-                
-            pbar.update(1)
-                    
-    pbar.close()
-
-    print('all data num >>', len(paths))
+    print(' - Rotation >>', rot)
+
+    # (hf, vf, rot) of the variants of every image, in the order they were listed before
+    variants = [(False, False, 0)]
+    # horizontal flip
+    if hf:
+        variants.append((True, False, 0))
+    # vertical flip
+    if vf:
+        variants.append((False, True, 0))
+    # horizontal and vertical flip
+    if hf and vf:
+        variants.append((True, True, 0))
+    # rotation, every multiple of rot below 360
+    if rot is not False:
+        variants += [(False, False, angle) for angle in range(rot, 360, rot)]
+    variants = np.array(variants, dtype=np.int16)
+
+    samples = np.empty(len(files) * len(variants), dtype=sample_dtype)
+    samples['path'] = np.repeat(np.arange(len(files), dtype=np.int32), len(variants))
+    samples['hf'] = np.tile(variants[:, 0], len(files))
+    samples['vf'] = np.tile(variants[:, 1], len(files))
+    samples['rot'] = np.tile(variants[:, 2], len(files))
+
+    table = np.array(files)
+    table_gt = np.array([f.replace("images", "seg_images").replace(".jpg", ".png") for f in files])
+
+    print('all data num >>', len(samples))
     print('dataset was completely loaded')
     print('--')
 
-    
-    return {'paths' : np.array(paths), 'paths_gt' : np.array(paths_gt)}
-
-
-def get_image(infos, cfg, mode):
-    xs = []
-    
-    for info in infos:
-        path = info['path']
-        hf = info['hf']
-        vf = info['vf']
-        rot = info['rot']
-        x = cv2.imread(path)
-
-        # resize
-        x = cv2.resize(x, (cfg.OUTPUT_WIDTH, cfg.OUTPUT_HEIGHT)).astype(np.float32)
-        
-        # channel BGR -> Gray
-        if mode == 'GRAY':
-            x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY)
-            x = np.expand_dims(x, axis=-1)
-        elif mode == 'EDGE':
-            x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY)
-            x = cv2.Canny(x, 100, 150)
-            x = np.expand_dims(x, axis=-1)
-
-        # horizontal flip
+    # paths_gt shares the rows, only the path table differs
+    return {'paths' : SampleIndex(table, samples), 'paths_gt' : SampleIndex(table_gt, samples)}
+
+
+# func over items in order, on a thread pool when num_workers > 1 (-1 : one per core).
+# cv2 decode / resize / warp release the GIL, so threads scale without pickling the images.
+# no more threads than items, so a single item (e.g. GenerativeDataset.__getitem__) starts no pool
+def map_ordered(func, items, num_workers=0):
+    if num_workers < 0:
+        num_workers = os.cpu_count()
+    num_workers = min(num_workers, len(items))
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            return list(pool.map(func, items))
+
+    return [func(item) for item in items]
+
+
+# byte-bounded LRU of decoded images, shared by the threads of map_ordered.
+# the arrays are stored read-only, as every variant of a path reads the same copy
+class ImageCache():
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # the cached value of key, or load() stored under key. two threads missing the same key
+    # both load it, which is cheaper than holding the lock during the decode
+    def get(self, key, load):
+        with self.lock:
+            x = self.items.get(key)
+            if x is not None:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return x
+            self.misses += 1
+
+        x = load()
+        x.flags.writeable = False
+        if x.nbytes > self.max_bytes:
+            return x
+
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = x
+                self.nbytes += x.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self.items.popitem(last=False)
+                self.nbytes -= old.nbytes
+        return x
+
+    # a smaller budget evicts the oldest images right away, not on the next insertion
+    def set_max_bytes(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.nbytes > max(max_bytes, 0):
+                _, old = self.items.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.nbytes = 0
+
+
+# cfg.IMAGE_CACHE_BYTES (optional) bounds it, set once by data_load (and by the DataLoader workers),
+# 0 decodes every image every time as before
+image_cache_bytes = 512 * 1024 ** 2
+image_cache = ImageCache(image_cache_bytes)
+
+
+# the resized image of path as in get_image_one before the augmentation, through image_cache
+# keyed on (path, size, mode, reduced decode) : uint8 BGR for every color mode, float32 gray for GRAY
+# and the uint8 Canny edges of the uint8 gray for EDGE, both derived from the cached BGR
+def get_decoded(path, cfg, mode):
+    size = (cfg.OUTPUT_WIDTH, cfg.OUTPUT_HEIGHT)
+    # a reduced and a full decode of the same path differ, so cfg.REDUCED_DECODE is part of the key
+    reduced = cfg.get('REDUCED_DECODE', False)
+
+    if mode == 'GRAY':
+        load = lambda: np.expand_dims(cv2.cvtColor(get_decoded(path, cfg, 'BGR').astype(np.float32), cv2.COLOR_BGR2GRAY), axis=-1)
+    elif mode == 'EDGE':
+        load = lambda: np.expand_dims(cv2.Canny(cv2.cvtColor(get_decoded(path, cfg, 'BGR'), cv2.COLOR_BGR2GRAY), 100, 150), axis=-1)
+    elif mode == 'CLASS_LABEL':
+        # label colors must stay exact, so no reduced decode
+        reduced = False
+        load = lambda: decode_resized(path, size, reduced=False)
+    else:
+        mode = 'BGR'
+        load = lambda: decode_resized(path, size, reduced=reduced)
+
+    if image_cache.max_bytes <= 0:
+        return load()
+    return image_cache.get((path, size, mode, reduced), load)
+
+
+# (width, height) from the SOF marker of jpeg bytes, None if buf is no jpeg
+def jpeg_size(buf):
+    if buf[:2].tobytes() != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 < len(buf):
+        if buf[i] != 0xff:
+            return None
+        marker = buf[i + 1]
+        if marker in [0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf]:
+            return (int(buf[i + 7]) << 8 | int(buf[i + 8]), int(buf[i + 5]) << 8 | int(buf[i + 6]))
+        i += 2 + (int(buf[i + 2]) << 8 | int(buf[i + 3]))
+    return None
+
+
+# uint8 BGR of path resized to size. a jpeg at least 2, 4 or 8 times larger than size on both sides
+# is decoded at that reduced resolution (IMREAD_REDUCED_COLOR_*), which skips most of the decode work.
+# the reduced decode averages the pixels it drops, so it is smoother than resizing the full image
+# and the pixels differ from cv2.imread + cv2.resize : opt-in through cfg.REDUCED_DECODE = True
+def decode_resized(path, size, reduced=False):
+    buf = np.fromfile(path, dtype=np.uint8)
+    flag = cv2.IMREAD_COLOR
+    src_size = jpeg_size(buf) if reduced else None
+    if src_size is not None:
+        # min / max, as the exif orientation may swap the sides
+        ratio = min(src_size) / max(size)
+        for k, reduced_flag in [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]:
+            if ratio >= k:
+                flag = reduced_flag
+                break
+    x = cv2.imdecode(buf, flag)
+    if x is None:
+        raise Exception('invalid image >> ', path, 'could not be read')
+
+    if (x.shape[1], x.shape[0]) == tuple(size):
+        return x
+    return cv2.resize(x, size)
+
+
+# flip + rotation of one sample as a single 2x3 matrix from the decoded image (w x h) to the output (w x h) :
+# flip, paste into a zero max_side square, rotate rot degrees around its center and crop the image back out.
+# None when there is no rotation, the flips are then only views
+def augment_matrix(w, h, hf, vf, rot):
+    if rot == 0:
+        return None
+
+    max_side = max(h, w)
+    tx = int((max_side - w) / 2)
+    ty = int((max_side - h) / 2)
+
+    flip = np.array([[-1 if hf else 1, 0, w - 1 if hf else 0],
+                     [0, -1 if vf else 1, h - 1 if vf else 0],
+                     [0, 0, 1]], dtype=np.float64)
+    paste = np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64)
+    rotate = np.vstack((cv2.getRotationMatrix2D((max_side / 2, max_side / 2), rot, 1), [0, 0, 1]))
+    crop = np.array([[1, 0, -tx], [0, 1, -ty], [0, 0, 1]], dtype=np.float64)
+
+    return (crop @ rotate @ paste @ flip)[:2]
+
+
+# colour -> class id in one lookup : a BGR pixel packed into b | g << 8 | r << 16 indexes a 2 ** 24 table
+# of uint8 class ids (the order of class_label), colours of no class map to no_class
+no_class = 255
+
+def make_class_lut(class_label):
+    if len(class_label) >= no_class:
+        raise Exception('invalid class_label >> ', len(class_label), 'classes, should be <', no_class)
+    lut = np.full(1 << 24, no_class, dtype=np.uint8)
+    for i, (_, vs) in enumerate(class_label.items()):
+        lut[int(vs[0]) | int(vs[1]) << 8 | int(vs[2]) << 16] = i
+    return lut
+
+
+# the lut of each class_label, built once (16 MB each)
+class_luts = {}
+
+def get_class_lut(class_label):
+    key = tuple(tuple(vs) for vs in class_label.values())
+    lut = class_luts.get(key)
+    if lut is None:
+        lut = make_class_lut(class_label)
+        class_luts[key] = lut
+    return lut
+
+
+# uint8 [..., 3] BGR -> uint8 [...] class ids, the same for any number of classes
+def encode_class(x, lut):
+    x = x.astype(np.uint32)
+    return lut[x[..., 0] | x[..., 1] << 8 | x[..., 2] << 16]
+
+
+# class ids [...] -> one-hot [..., class_num], all zero for no_class
+def to_one_hot(ids, class_num, dtype=np.float32):
+    return (ids[..., None] == np.arange(class_num, dtype=ids.dtype)).astype(dtype)
+
+
+def get_image_one(info, cfg, mode):
+    path = info['path']
+    hf = info['hf']
+    vf = info['vf']
+    rot = info['rot']
+
+    # resized (and for GRAY / EDGE converted) image, decoded once for all variants and epochs
+    x = get_decoded(path, cfg, mode)
+    _h, _w, _c = x.shape
+
+    # one warp of the decoded image for flip + rotation, or views when there is only a flip
+    M = augment_matrix(_w, _h, hf, vf, rot)
+    if M is None:
         if hf:
             x = x[:, ::-1]
-
-        # vertical flip
         if vf:
             x = x[::-1]
+    else:
+        x = cv2.warpAffine(x, M, (_w, _h)).reshape(_h, _w, _c)
+
+    if mode == 'CLASS_LABEL':
+        # uint8 [h, w] class ids
+        x = encode_class(x, get_class_lut(cfg.CLASS_LABEL))
+
+    else:
+        # normalization [0, 255] -> [-1, 1]
+        x = x.astype(np.float32) / 127.5 - 1
+
+        # channel BGR -> RGB
+        if mode in ['RGB']:
+            x = x[..., ::-1]
+
+    return x
+
+
+# cfg.NUM_WORKERS (optional) decodes the minibatch on a thread pool,
+# cfg.REDUCED_DECODE (optional, False) decodes large jpegs at a reduced resolution.
+# CLASS_LABEL gives uint8 [mb, h, w] class ids (no_class where a colour is no class),
+# or with one_hot=True float32 [mb, h, w, cfg.CLASS_NUM] as to_one_hot(ids, cfg.CLASS_NUM)
+def get_image(infos, cfg, mode, one_hot=False):
+    xs = map_ordered(lambda info: get_image_one(info, cfg, mode), infos, num_workers=cfg.get('NUM_WORKERS', 0))
+
+    if mode == 'CLASS_LABEL':
+        xs = np.array(xs, dtype=np.uint8)
+        if one_hot:
+            xs = to_one_hot(xs, cfg.CLASS_NUM)
+        return xs
 
-        # rotation
-        scale = 1
-        _h, _w, _c = x.shape
-        max_side = max(_h, _w)
-        tmp = np.zeros((max_side, max_side, _c))
-        tx = int((max_side - _w) / 2)
-        ty = int((max_side - _h) / 2)
-        tmp[ty: ty+_h, tx: tx+_w] = x.copy()
-        M = cv2.getRotationMatrix2D((max_side / 2, max_side / 2), rot, scale)
-        _x = cv2.warpAffine(tmp, M, (max_side, max_side))
-        x = _x[tx:tx+_w, ty:ty+_h]
-
-        if mode == 'CLASS_LABEL':
-            _x = x
-            x = np.zeros((cfg.OUTPUT_HEIGHT, cfg.OUTPUT_WIDTH, cfg.CLASS_NUM), dtype=np.int)
-
-            for i, (_, vs) in enumerate(cfg.CLASS_LABEL.items()):
-                ind = (_x[..., 0] == vs[0]) * (_x[..., 1] == vs[1]) * (_x[..., 2] == vs[2])
-                x[..., i][ind] = 1
-
-        else:
-            # normalization [0, 255] -> [-1, 1]
-            x = x / 127.5 - 1
-
-            # channel BGR -> RGB
-            if mode in ['RGB']:
-                x = x[..., ::-1]
-
-        xs.append(x)
-                
     xs = np.array(xs, dtype=np.float32)
 
-    return xs
\ No newline at end of file
+    return xs
+
+
+# minibatch indices with epoch-exact shuffling : every sample is drawn once per epoch,
+# and a batch crossing the epoch end takes the rest of the old order then the head of a new one.
+# sampler() returns the indices, or fetch(indices) (e.g. a dataset gather + augmentation) when fetch is given.
+# prefetch=K assembles the next K batches on a background thread while the model computes.
+# every tree runs from its own directory, so Scripts_Theory2/answers/_neuralnet.py and tf/_main_base.py hold the same class : change them together
+class MinibatchSampler():
+    def __init__(self, data_num, mb, shuffle=True, fetch=None, prefetch=0, seed=None):
+        self.data_num = data_num
+        self.mb = mb
+        self.shuffle = shuffle
+        self.fetch = fetch
+        self.prefetch = prefetch
+        self.epoch = 0
+        self.mbi = 0
+
+        # own random state, so the batches do not depend on the thread drawing them
+        self.rng = np.random.RandomState(np.random.randint(2 ** 31 - 1) if seed is None else seed)
+        self.inds = self.new_order()
+
+        self.queue = None
+        if prefetch > 0:
+            if fetch is None:
+                raise Exception('prefetch needs fetch')
+            self.queue = queue.Queue(maxsize=prefetch)
+            self.stop = threading.Event()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def new_order(self):
+        if self.shuffle:
+            return self.rng.permutation(self.data_num)
+        return np.arange(self.data_num)
+
+    def next_ind(self):
+        mb_ind = self.inds[self.mbi: self.mbi + self.mb]
+        self.mbi += self.mb
+
+        while len(mb_ind) < self.mb:
+            self.inds = self.new_order()
+            self.epoch += 1
+            self.mbi = self.mb - len(mb_ind)
+            mb_ind = np.hstack((mb_ind, self.inds[:self.mbi]))
+
+        return mb_ind
+
+    def worker(self):
+        while not self.stop.is_set():
+            try:
+                batch = (True, self.fetch(self.next_ind()))
+            except Exception as e:
+                batch = (False, e)
+
+            # wake up now and then to see if the sampler was closed
+            while not self.stop.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if not batch[0]:
+                return
+
+    def __call__(self):
+        if self.queue is None:
+            mb_ind = self.next_ind()
+            return mb_ind if self.fetch is None else self.fetch(mb_ind)
+
+        ok, batch = self.queue.get()
+        if not ok:
+            raise batch
+        return batch
+
+    def close(self):
+        if self.queue is not None:
+            self.stop.set()
+            self.thread.join()
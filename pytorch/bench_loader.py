@@ -0,0 +1,101 @@
+import argparse
+import time
+import numpy as np
+import torch
+from easydict import EasyDict
+from _main_base_generative import data_load, get_image
+from _main_base_dataloader import GenerativeDataset, get_dataloader, loop
+
+# images / sec of the minibatches the notebooks train on : get_image inline in the training loop
+# against GenerativeDataset + DataLoader with 0, 1, 2, ... worker processes.
+# --step_ms stands for the model step (a sleep, as a gpu step leaves the cpu free), the loader hides the decoding behind it.
+#   python bench_loader.py --workers 0,1,2,4 --step_ms 20
+#   python bench_loader.py --no_cache        # decode every image every time
+parser = argparse.ArgumentParser()
+parser.add_argument('--data_path', default='../Dataset/train/images/')
+parser.add_argument('--mb', type=int, default=8)
+parser.add_argument('--size', type=int, default=64)
+parser.add_argument('--mode', default='RGB', help='RGB, BGR, GRAY, EDGE')
+parser.add_argument('--gt_mode', default=None, help='CLASS_LABEL also loads the seg_images of paths_gt')
+parser.add_argument('--iteration', type=int, default=200)
+parser.add_argument('--step_ms', type=float, default=0., help='simulated model step')
+parser.add_argument('--workers', default='0,1,2,4', help='comma separated num_workers of the DataLoader')
+parser.add_argument('--prefetch_factor', type=int, default=2)
+parser.add_argument('--no_cache', action='store_true', help='IMAGE_CACHE_BYTES = 0')
+args = parser.parse_args()
+
+cfg = EasyDict()
+cfg.OUTPUT_HEIGHT = args.size
+cfg.OUTPUT_WIDTH = args.size
+cfg.CHANNEL_AXIS = 1
+cfg.CLASS_LABEL = {'background' : [0, 0, 0], 'akahara' : [0, 0, 128], 'madara' : [0, 128, 0]}
+cfg.CLASS_NUM = len(cfg.CLASS_LABEL)
+if args.no_cache:
+    cfg.IMAGE_CACHE_BYTES = 0
+cfg.TRAIN = EasyDict()
+cfg.TRAIN.DATA_PATH = args.data_path
+cfg.TRAIN.DATA_HORIZONTAL_FLIP = True
+cfg.TRAIN.DATA_VERTICAL_FLIP = True
+cfg.TRAIN.DATA_ROTATION = False
+
+path_dict = data_load(cfg)
+paths, paths_gt = path_dict['paths'], path_dict['paths_gt']
+train_N = len(paths)
+
+
+def step():
+    if args.step_ms > 0:
+        time.sleep(args.step_ms / 1000)
+
+
+# the notebooks : shuffled indices, get_image, tensor, permute, then the model
+def inline():
+    np.random.seed(0)
+    train_ind = np.arange(train_N)
+    np.random.shuffle(train_ind)
+    mbi = 0
+    for _ in range(args.iteration):
+        if mbi + args.mb > train_N:
+            np.random.shuffle(train_ind)
+            mbi = 0
+        mb_ind = train_ind[mbi: mbi + args.mb]
+        mbi += args.mb
+
+        torch.tensor(get_image(paths[mb_ind], cfg, args.mode), dtype=torch.float).permute(0, 3, 1, 2)
+        if args.gt_mode is not None:
+            torch.tensor(get_image(paths_gt[mb_ind], cfg, args.gt_mode))
+        step()
+
+
+def loader(num_workers):
+    gt_modes = [] if args.gt_mode is None else [args.gt_mode]
+    dataset = GenerativeDataset(cfg, [args.mode], gt_modes=gt_modes, path_dict=path_dict)
+    batches = loop(get_dataloader(dataset, cfg, args.mb, num_workers=num_workers, prefetch_factor=args.prefetch_factor))
+    # the workers start on the first batch, which is not timed
+    next(batches)
+
+    t = time.perf_counter()
+    for _ in range(args.iteration):
+        next(batches)
+        step()
+    return time.perf_counter() - t
+
+
+results = []
+
+# one pass first, so the image cache is filled the same as for the persistent workers
+inline()
+t = time.perf_counter()
+inline()
+results.append(('inline get_image', time.perf_counter() - t))
+
+for num_workers in [int(w) for w in args.workers.split(',')]:
+    results.append(('DataLoader num_workers={}'.format(num_workers), loader(num_workers)))
+
+print()
+print('mb={} size={} mode={} gt_mode={} step_ms={} cache={}'.format(
+    args.mb, args.size, args.mode, args.gt_mode, args.step_ms, not args.no_cache))
+print('{:32s} {:>10s} {:>12s} {:>8s}'.format('', 'ms/iter', 'images/sec', 'speedup'))
+base = results[0][1]
+for name, t in results:
+    print('{:32s} {:10.2f} {:12.1f} {:8.2f}'.format(name, t / args.iteration * 1e3, args.iteration * args.mb / t, base / t))
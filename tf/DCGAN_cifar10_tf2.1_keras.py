@@ -13,6 +13,7 @@ from tensorflow.keras.layers import *
 from tensorflow.keras.initializers import RandomNormal as RN, Constant
 import pickle
 import os
+from _main_base import MinibatchSampler, MetricsRecorder
 
 # config
 class_N = 2
@@ -26,6 +27,8 @@ test_N = 10
 
 # model path
 model_path = 'DCGAN.h5'
+# loss of every iteration, iteration,loss_G,loss_D
+loss_path = 'DCGAN_loss.csv'
 
 
 
@@ -127,10 +130,9 @@ def train():
 
     # training
     mb = 64
-    mbi = 0
-    train_N = len(xs)
-    train_ind = np.arange(train_N)
     np.random.seed(0)
+    # the next batches are gathered on a background thread
+    sampler = MinibatchSampler(len(xs), mb, fetch=lambda mb_ind: xs[mb_ind], prefetch=4)
 
     @tf.function
     def train_iter(x, z):
@@ -165,22 +167,16 @@ def train():
     G_optimizer = tf.keras.optimizers.Adam(2e-4, beta_1=0.5)
     D_optimizer = tf.keras.optimizers.Adam(2e-4, beta_1=0.5)
 
-    for ite in range(10000):
-        if mbi + mb > train_N:
-            mb_ind = train_ind[mbi:]
-            np.random.shuffle(train_ind)
-            mb_ind = np.hstack((mb_ind, train_ind[:(mb - (train_N - mbi))]))
-            mbi = mb - (train_N - mbi)
-        else:
-            mb_ind = train_ind[mbi : mbi + mb]
-            mbi += mb
+    recorder = MetricsRecorder(['loss_G', 'loss_D'], path=loss_path, lazy=True)
 
-        x = xs[mb_ind]
+    for ite in range(10000):
+        x = sampler()
 
         z = np.random.uniform(-1, 1, size=(mb, Z_dim))
         #z = tf.random.normal([mb, Z_dim])
 
         loss_G, loss_D = train_iter(x, z)
+        recorder.record(ite + 1, loss_G, loss_D)
         
         if (ite + 1) % 100 == 0:
             print("iter :", ite+1, ', Loss_G :', loss_G.numpy(), ',Loss_D :', loss_D.numpy())
@@ -195,6 +191,9 @@ def train():
                 plt.axis('off')
             plt.show()
 
+    sampler.close()
+    recorder.close()
+
     # save model
     G.save_weights(model_path)
 
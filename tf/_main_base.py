@@ -0,0 +1,239 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+import queue
+import threading
+
+
+# func over items in order, on a thread pool when num_workers > 1 (-1 : one per core).
+# cv2 decode / resize / warp release the GIL, so threads scale without pickling the images.
+# no more threads than items, so a single item starts no pool
+def map_ordered(func, items, num_workers=0):
+    if num_workers < 0:
+        num_workers = os.cpu_count()
+    num_workers = min(num_workers, len(items))
+
+    if num_workers > 1:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            return list(pool.map(func, items))
+
+    return [func(item) for item in items]
+
+
+# minibatch indices with epoch-exact shuffling : every sample is drawn once per epoch,
+# and a batch crossing the epoch end takes the rest of the old order then the head of a new one.
+# sampler() returns the indices, or fetch(indices) (e.g. a dataset gather + augmentation) when fetch is given.
+# prefetch=K assembles the next K batches on a background thread while the model computes.
+# every tree runs from its own directory, so Scripts_Theory2/answers/_neuralnet.py and pytorch/_main_base_generative.py hold the same class : change them together
+class MinibatchSampler():
+    def __init__(self, data_num, mb, shuffle=True, fetch=None, prefetch=0, seed=None):
+        self.data_num = data_num
+        self.mb = mb
+        self.shuffle = shuffle
+        self.fetch = fetch
+        self.prefetch = prefetch
+        self.epoch = 0
+        self.mbi = 0
+
+        # own random state, so the batches do not depend on the thread drawing them
+        self.rng = np.random.RandomState(np.random.randint(2 ** 31 - 1) if seed is None else seed)
+        self.inds = self.new_order()
+
+        self.queue = None
+        if prefetch > 0:
+            if fetch is None:
+                raise Exception('prefetch needs fetch')
+            self.queue = queue.Queue(maxsize=prefetch)
+            self.stop = threading.Event()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    def new_order(self):
+        if self.shuffle:
+            return self.rng.permutation(self.data_num)
+        return np.arange(self.data_num)
+
+    def next_ind(self):
+        mb_ind = self.inds[self.mbi: self.mbi + self.mb]
+        self.mbi += self.mb
+
+        while len(mb_ind) < self.mb:
+            self.inds = self.new_order()
+            self.epoch += 1
+            self.mbi = self.mb - len(mb_ind)
+            mb_ind = np.hstack((mb_ind, self.inds[:self.mbi]))
+
+        return mb_ind
+
+    def worker(self):
+        while not self.stop.is_set():
+            try:
+                batch = (True, self.fetch(self.next_ind()))
+            except Exception as e:
+                batch = (False, e)
+
+            # wake up now and then to see if the sampler was closed
+            while not self.stop.is_set():
+                try:
+                    self.queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if not batch[0]:
+                return
+
+    def __call__(self):
+        if self.queue is None:
+            mb_ind = self.next_ind()
+            return mb_ind if self.fetch is None else self.fetch(mb_ind)
+
+        ok, batch = self.queue.get()
+        if not ok:
+            raise batch
+        return batch
+
+    def close(self):
+        if self.queue is not None:
+            self.stop.set()
+            self.thread.join()
+
+
+# per-step metrics in a preallocated [capacity, 1 + len(names)] ring buffer (iteration, then the metrics).
+# record() keeps one row every `every` steps : the values of that step (reduce='last') or the mean of the
+# window (reduce='mean'), and a background thread appends the rows to path every flush_interval seconds,
+# or once capacity // 2 rows are waiting. path ending in .npy writes a [rows, 1 + len(names)] float64 array,
+# anything else a csv with the header iteration,name,..., so pd.read_csv readers keep working even mid-run.
+# memory stays at capacity rows however long the run, recent() returns the rows still in the ring.
+# lazy=True keeps the values as given (e.g. tf / torch scalar tensors) and converts them with float() only when
+# the rows are flushed or read, so record() does not wait for the device every step.
+# Scripts_Theory2/answers/_metrics.py and tf/_main_base.py hold the same class : change them together
+class MetricsRecorder():
+    def __init__(self, names, path=None, every=1, reduce='last', capacity=4096, flush_interval=1., lazy=False):
+        if reduce not in ['last', 'mean']:
+            raise Exception('invalid reduce >> ', reduce, 'should be last or mean')
+        self.names = list(names)
+        self.path = path
+        self.every = every
+        self.reduce = reduce
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self.buf = np.zeros((capacity, 1 + len(self.names)), dtype=np.float64)
+        self.acc = np.zeros(len(self.names), dtype=np.float64)
+        self.acc_num = 0
+        # lazy : the unconverted values of every row (a list of per-step values), and of the running window
+        self.lazy = lazy
+        self.pending = [None] * capacity if lazy else None
+        self.window = []
+        # rows recorded / rows written to path / rows converted into buf
+        self.n = 0
+        self.flushed = 0
+        self.converted = 0
+        self.lock = threading.Lock()
+
+        self.f = None
+        self.thread = None
+        if path is not None:
+            self.npy = path.endswith('.npy')
+            self.f = open(path, 'wb')
+            if self.npy:
+                self.write_npy_header()
+            else:
+                self.f.write((','.join(['iteration'] + self.names) + '\n').encode())
+            self.wake = threading.Event()
+            self.stop = threading.Event()
+            self.thread = threading.Thread(target=self.worker, daemon=True)
+            self.thread.start()
+
+    # the header is padded to a fixed 128 bytes, so it can be rewritten with the final row count in place
+    def write_npy_header(self):
+        header = "{{'descr': '<f8', 'fortran_order': False, 'shape': ({}, {}), }}".format(
+            self.flushed, 1 + len(self.names))
+        header = header.ljust(128 - 10 - 1) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode())
+        self.f.seek(0, 2)
+
+    def record(self, iteration, *values, **named):
+        if len(named) > 0:
+            values = [named[name] for name in self.names]
+
+        if self.reduce == 'mean':
+            if self.lazy:
+                self.window.append(values)
+            else:
+                self.acc += values
+                self.acc_num += 1
+        if iteration % self.every != 0:
+            return
+
+        if self.n - self.flushed >= self.capacity:
+            # the writer fell a whole ring behind, write out here rather than drop rows
+            self.flush()
+
+        row = self.buf[self.n % self.capacity]
+        row[0] = iteration
+        if self.lazy:
+            self.pending[self.n % self.capacity] = self.window if self.reduce == 'mean' else [values]
+            self.window = []
+        elif self.reduce == 'mean':
+            np.divide(self.acc, self.acc_num, out=row[1:])
+            self.acc[:] = 0
+            self.acc_num = 0
+        else:
+            row[1:] = values
+        self.n += 1
+
+        if self.thread is not None and self.n - self.flushed >= self.capacity // 2:
+            self.wake.set()
+
+    # lazy : the values of the rows up to end into buf, the rows the ring already overwrote are skipped
+    def materialize(self, end):
+        if not self.lazy:
+            return
+        for i in range(max(self.converted, end - self.capacity), end):
+            window = self.pending[i % self.capacity]
+            self.buf[i % self.capacity, 1:] = np.mean([[float(v) for v in values] for values in window], axis=0)
+            self.pending[i % self.capacity] = None
+        self.converted = max(self.converted, end)
+
+    def recent(self):
+        with self.lock:
+            n = self.n
+            self.materialize(n)
+            return self.buf[np.arange(max(n - self.capacity, 0), n) % self.capacity]
+
+    def flush(self):
+        with self.lock:
+            if self.f is None:
+                return
+            start, end = self.flushed, self.n
+            self.materialize(end)
+            for i in range(start, end, self.capacity):
+                rows = self.buf[np.arange(i, min(end, i + self.capacity)) % self.capacity]
+                if self.npy:
+                    self.f.write(rows.tobytes())
+                else:
+                    np.savetxt(self.f, rows, delimiter=',', fmt=['%d'] + ['%.8g'] * len(self.names))
+            self.flushed = end
+            self.f.flush()
+
+    def worker(self):
+        while not self.stop.is_set():
+            self.wake.wait(timeout=self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def close(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.wake.set()
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        if self.f is not None:
+            if self.npy:
+                self.write_npy_header()
+            self.f.close()
+            self.f = None
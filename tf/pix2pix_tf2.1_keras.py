@@ -6,8 +6,8 @@ import argparse
 import cv2
 import numpy as np
 from glob import glob
+from _main_base import MinibatchSampler, MetricsRecorder, map_ordered
 import matplotlib.pyplot as plt
-from copy import copy
 from collections import OrderedDict
 from tqdm import tqdm
 
@@ -23,11 +23,14 @@ out_channel = class_N
 
 model_path_G = 'pix2pix_G.h5'
 model_path_D = 'pix2pix_D.h5'
+# losses of every iteration, iteration,G_loss,...
+loss_path = 'pix2pix_loss.csv'
 
 # training config
 Batchsize = 16
 Iteration = 5000
 Loss_Lambda = 10.
+Num_workers = 0 # threads decoding a minibatch, -1 : one per core
 
 def UNet():
     def UNet_block_downSampling(x, filters, size, name, apply_batchnorm=False):
@@ -136,64 +139,86 @@ def data_load(path, hf=False, vf=False, rot=False):
     
     return np.array(paths), np.array(paths_gt)
 
-def get_image(infos, gt=False):
-    xs = []
+# colour -> class id in one lookup : a BGR pixel packed into b | g << 8 | r << 16 indexes a 2 ** 24 table
+# of uint8 class ids (the order of class_label), colours of no class map to no_class
+no_class = 255
+
+def make_class_lut(class_label):
+    if len(class_label) >= no_class:
+        raise Exception('invalid class_label >> ', len(class_label), 'classes, should be <', no_class)
+    lut = np.full(1 << 24, no_class, dtype=np.uint8)
+    for i, (_, vs) in enumerate(class_label.items()):
+        lut[int(vs[0]) | int(vs[1]) << 8 | int(vs[2]) << 16] = i
+    return lut
+
+class_lut = make_class_lut(class_label)
+
+
+# uint8 [..., 3] BGR -> uint8 [...] class ids, the same for any number of classes
+def encode_class(x, lut):
+    x = x.astype(np.uint32)
+    return lut[x[..., 0] | x[..., 1] << 8 | x[..., 2] << 16]
+
+
+def get_image_one(info, gt=False):
+    path = info['path']
+    hf = info['hf']
+    vf = info['vf']
+    rot = info['rot']
+    x = cv2.imread(path)
+
+    # resize
+    if gt:
+        x = cv2.resize(x, (img_width, img_height)).astype(np.float32)
+    else:
+        x = cv2.resize(x, (out_width, out_height)).astype(np.float32)
     
-    for info in infos:
-        path = info['path']
-        hf = info['hf']
-        vf = info['vf']
-        rot = info['rot']
-        x = cv2.imread(path)
-
-        # resize
-        if gt:
-            x = cv2.resize(x, (img_width, img_height)).astype(np.float32)
-        else:
-            x = cv2.resize(x, (out_width, out_height)).astype(np.float32)
-        
-        # channel BGR -> Gray
-        if channel == 1:
-            x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY)
-            x = np.expand_dims(x, axis=-1)
-
-        # horizontal flip
-        if hf:
-            x = x[:, ::-1]
-
-        # vertical flip
-        if vf:
-            x = x[::-1]
-
-        # rotation
-        scale = 1
-        _h, _w, _c = x.shape
-        max_side = max(_h, _w)
-        tmp = np.zeros((max_side, max_side, _c))
-        tx = int((max_side - _w) / 2)
-        ty = int((max_side - _h) / 2)
-        tmp[ty: ty+_h, tx: tx+_w] = x.copy()
-        M = cv2.getRotationMatrix2D((max_side / 2, max_side / 2), rot, scale)
-        _x = cv2.warpAffine(tmp, M, (max_side, max_side))
-        x = _x[tx:tx+_w, ty:ty+_h]
-
-        if gt:
-            _x = x
-            x = np.zeros((out_height, out_width, class_N), dtype=np.int)
-
-            for i, (_, vs) in enumerate(class_label.items()):
-                ind = (_x[..., 0] == vs[0]) * (_x[..., 1] == vs[1]) * (_x[..., 2] == vs[2])
-                x[..., i][ind] = 1
-        else:
-            # normalization [0, 255] -> [-1, 1]
-            x = x / 127.5 - 1
-
-            # channel BGR -> RGB
-            if channel == 3:
-                x = x[..., ::-1]
-
-        xs.append(x)
-                
+    # channel BGR -> Gray
+    if channel == 1:
+        x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY)
+        x = np.expand_dims(x, axis=-1)
+
+    # horizontal flip
+    if hf:
+        x = x[:, ::-1]
+
+    # vertical flip
+    if vf:
+        x = x[::-1]
+
+    # rotation
+    scale = 1
+    _h, _w, _c = x.shape
+    max_side = max(_h, _w)
+    tmp = np.zeros((max_side, max_side, _c))
+    tx = int((max_side - _w) / 2)
+    ty = int((max_side - _h) / 2)
+    tmp[ty: ty+_h, tx: tx+_w] = x.copy()
+    M = cv2.getRotationMatrix2D((max_side / 2, max_side / 2), rot, scale)
+    _x = cv2.warpAffine(tmp, M, (max_side, max_side))
+    x = _x[tx:tx+_w, ty:ty+_h]
+
+    if gt:
+        # uint8 [h, w] class ids
+        x = encode_class(np.rint(x).astype(np.uint8), class_lut)
+    else:
+        # normalization [0, 255] -> [-1, 1]
+        x = x / 127.5 - 1
+
+        # channel BGR -> RGB
+        if channel == 3:
+            x = x[..., ::-1]
+
+    return x
+
+
+# gt=True gives uint8 [mb, h, w] class ids, tf.one_hot(xs, class_N) expands them (no_class -> all zero)
+def get_image(infos, gt=False):
+    xs = map_ordered(lambda info: get_image_one(info, gt=gt), infos, num_workers=Num_workers)
+
+    if gt:
+        return np.array(xs, dtype=np.uint8)
+
     xs = np.array(xs, dtype=np.float32)
 
     return xs
@@ -211,8 +236,11 @@ def train():
     
     paths, paths_gt = data_load('../Dataset/train/images/', hf=True, vf=True, rot=False)
 
+    # target : uint8 class ids, expanded to one-hot on the device
     @tf.function
     def train_step(x, target):
+        target = tf.one_hot(target, class_N)
+
         with tf.GradientTape() as G_tape, tf.GradientTape() as D_tape:
             Gx = G(x, training=True)
 
@@ -241,26 +269,18 @@ def train():
         return {'G_loss' : G_loss, 'G_loss_fake' : G_loss_fake, 'G_loss_L1' : G_loss_L1, 'D_loss' : D_loss, 'D_loss_real' : D_loss_real, 'D_loss_fake' : D_loss_fake}
     
     # training
-    mbi = 0
-    train_N = len(paths)
-    train_ind = np.arange(train_N)
     np.random.seed(0)
-    np.random.shuffle(train_ind)
+    # the next batches are decoded on a background thread
+    sampler = MinibatchSampler(len(paths), Batchsize, prefetch=4,
+                               fetch=lambda mb_ind: (get_image(paths[mb_ind]), get_image(paths_gt[mb_ind], gt=True)))
+
+    recorder = MetricsRecorder(['G_loss', 'G_loss_fake', 'G_loss_L1', 'D_loss', 'D_loss_real', 'D_loss_fake'], path=loss_path, lazy=True)
 
     for i in range(Iteration):
-        if mbi + Batchsize > train_N:
-            mb_ind = copy(train_ind[mbi:])
-            np.random.shuffle(train_ind)
-            mb_ind = np.hstack((mb_ind, train_ind[:(Batchsize - (train_N - mbi))]))
-            mbi = Batchsize - (train_N - mbi)
-        else:
-            mb_ind = train_ind[mbi : mbi + Batchsize]
-            mbi += Batchsize
-        
-        Xs = get_image(paths[mb_ind])
-        Xs_target = get_image(paths_gt[mb_ind], gt=True)
+        Xs, Xs_target = sampler()
         
         loss_dict = train_step(Xs, Xs_target)
+        recorder.record(i + 1, **loss_dict)
         
         print('|', end='')
 
@@ -272,6 +292,9 @@ def train():
             print('\riter : {} , G_Loss : {:.4f} (fake : {:.4f} , L1 : {:.4f}) , D_Loss : {:.4f} (fake : {:.4f} , real : {:.4f})'.format(
                 i + 1, loss_dict['G_loss'], loss_dict['G_loss_fake'], loss_dict['G_loss_L1'], loss_dict['D_loss'], loss_dict['D_loss_fake'], loss_dict['D_loss_real']))
 
+    sampler.close()
+    recorder.close()
+
     G.save_weights(model_path_G)
     D.save_weights(model_path_D)
 